@@ -0,0 +1,139 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+# Local modules
+from StockEngine import Portfolio, PriceEngine, Valuation
+
+REPEATS = 5
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter so import costs are measured cold, prints the timings as json
+STARTUP_SCRIPT = '''
+import importlib.util, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+spec = importlib.util.spec_from_file_location("StockManager", sys.argv[1] + "/StockManager(3.0).py")
+manager = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(manager)
+from StockProviders import FakeProvider
+imported = time.perf_counter() - start
+
+app = manager.App(FakeProvider(delay = float(sys.argv[2])))
+app.update()
+first_paint = time.perf_counter() - start
+
+while app.engine.last_prices is None and time.perf_counter() - start < 60:
+    app.update()
+    time.sleep(0.005)
+cached_values = time.perf_counter() - start
+
+while app.stale and time.perf_counter() - start < 60:
+    app.update()
+    time.sleep(0.005)
+fresh_prices = time.perf_counter() - start
+
+app.OnClose()
+print(json.dumps({"imports": imported, "first_paint": first_paint, "cached_values": cached_values, "fresh_prices": fresh_prices}))
+'''
+#endregion
+
+def Timed(function, repeats: int = REPEATS) -> float:
+    '''Best wall time in milliseconds over several runs'''
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def SyntheticHistory(count: int, weeks: int = 53, seed: int = 0) -> tuple:
+    '''Weekly close matrix and portfolio where a tenth of the tickers listed part way through the year'''
+    rng = np.random.default_rng(seed)
+    tickers = [f"T{index:04d}" for index in range(count)]
+    dates = pd.date_range(end = pd.Timestamp.today().normalize(), periods = weeks, freq = "W-MON")
+
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, (weeks, count)), axis = 0))
+    late_listings = rng.choice(count, max(1, count // 10), replace = False)
+    for column in late_listings:
+        closes[:rng.integers(1, weeks), column] = np.nan
+
+    portfolio = Portfolio([(ticker, quantity) for ticker, quantity in zip(tickers, rng.uniform(1, 100, count))])
+    return pd.DataFrame(closes, index = dates, columns = tickers), portfolio
+
+def LoopHistory(close_data: pd.DataFrame, portfolio: Portfolio) -> pd.Series:
+    '''Previous per-ticker Series.add aggregation, kept as the benchmark baseline'''
+    close_data = close_data.ffill()
+    total_history = None
+    for ticker, qty in portfolio.QuantityMap().items():
+        if ticker in close_data.columns:
+            series = close_data[ticker].fillna(0) * qty
+            total_history = series if total_history is None else total_history.add(series, fill_value = 0)
+    return total_history
+
+def BenchHistory(sizes: tuple = (10, 100, 1000)) -> None:
+    '''Compares the looped and matrix-vector portfolio history aggregation'''
+    engine = PriceEngine()
+    print("History aggregation (ms)")
+    print(f"{'tickers':>8} {'loop':>10} {'matmul':>10} {'speedup':>8}")
+
+    for count in sizes:
+        close_data, portfolio = SyntheticHistory(count)
+        _, values, _ = engine.AggregateHistory(close_data, portfolio)
+        assert np.allclose(values, LoopHistory(close_data, portfolio).to_numpy())
+
+        loop_ms = Timed(lambda: LoopHistory(close_data, portfolio))
+        matmul_ms = Timed(lambda: engine.AggregateHistory(close_data, portfolio))
+        print(f"{count:>8} {loop_ms:>10.2f} {matmul_ms:>10.2f} {loop_ms / matmul_ms:>7.1f}x")
+
+def BenchSort(sizes: tuple = (1000, 10000, 100000)) -> None:
+    '''Compares sorting list-of-dict rows with an argsort over the columnar Valuation'''
+    print("Sort by total value (ms) / row storage (KB)")
+    print(f"{'rows':>8} {'dicts':>10} {'argsort':>10} {'dict KB':>10} {'array KB':>10}")
+
+    for count in sizes:
+        rng = np.random.default_rng(count)
+        prices = rng.uniform(1, 500, count)
+        valuation = Valuation(np.array([f"T{index}" for index in range(count)], dtype = object), prices, prices * rng.uniform(0.95, 1.05, count), rng.uniform(1, 100, count))
+        rows = [
+            {'ticker': ticker, 'price': price, 'quantity': quantity, 'total': total, 'pct': pct, 'qty_change': change}
+            for ticker, price, quantity, total, pct, change in zip(valuation.tickers, valuation.price.tolist(), valuation.quantity.tolist(), valuation.total.tolist(), valuation.pct.tolist(), valuation.qty_change.tolist())
+        ]
+
+        dict_ms = Timed(lambda: sorted(rows, key = lambda x: x.get('total', 0), reverse = True))
+        argsort_ms = Timed(lambda: valuation.Sorted('total'))
+        dict_kb = (sys.getsizeof(rows) + sum(sys.getsizeof(row) for row in rows)) / 1024
+        array_kb = sum(getattr(valuation, name).nbytes for name in ("price", "prev_close", "quantity", "total", "qty_change", "pct")) / 1024
+        print(f"{count:>8} {dict_ms:>10.2f} {argsort_ms:>10.2f} {dict_kb:>10.0f} {array_kb:>10.0f}")
+
+def BenchStartup(count: int = 200, delay: float = 1.0) -> None:
+    '''Launches the app twice against a fake provider, the second launch starts from the first one's cache'''
+    print(f"Startup with {count} positions and {delay:.1f}s fetch latency (ms)")
+    print(f"{'launch':>8} {'imports':>10} {'paint':>10} {'cached':>10} {'fresh':>10}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        # the app keeps its files in the working directory, run it somewhere disposable
+        with open(os.path.join(folder, "portfolio.json"), "w") as file:
+            json.dump([{"ticker": f"T{index:04d}", "amount": "10"} for index in range(count)], file)
+
+        for launch in ("cold", "warm"):
+            result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, HERE, str(delay)], cwd = folder, capture_output = True, text = True, check = True)
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{launch:>8} {timings['imports'] * 1000:>10.0f} {timings['first_paint'] * 1000:>10.0f} {timings['cached_values'] * 1000:>10.0f} {timings['fresh_prices'] * 1000:>10.0f}")
+
+if __name__ == "__main__":
+    BenchHistory()
+    BenchSort()
+
+    # needs a display, so only when asked for
+    if "startup" in sys.argv[1:]: BenchStartup()
@@ -0,0 +1,587 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import asyncio
+import threading
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+# Local modules
+from StockProviders import FxTicker, MarketDataProvider, MarketOpen, MissingTickers, PeriodStart, ResampleWeekly, YFinanceProvider
+from StockStore import HistoryCache, QuoteCache
+
+# Currencies the table can be displayed in
+CURRENCY_SYMBOLS = {
+    "USD": "$",
+    "NZD": "NZ$",
+    "AUD": "A$",
+    "CAD": "C$",
+    "EUR": "€",
+    "GBP": "£",
+    "JPY": "¥",
+}
+DISPLAY_CURRENCIES = list(CURRENCY_SYMBOLS)
+
+# Trading currency implied by the Yahoo exchange suffix, anything without a suffix trades in USD
+SUFFIX_CURRENCIES = {
+    ".AX": "AUD",
+    ".NZ": "NZD",
+    ".TO": "CAD",
+    ".V": "CAD",
+    ".L": "GBp",
+    ".DE": "EUR",
+    ".PA": "EUR",
+    ".AS": "EUR",
+    ".MI": "EUR",
+    ".MC": "EUR",
+    ".SW": "CHF",
+    ".T": "JPY",
+    ".HK": "HKD",
+    ".SI": "SGD",
+}
+
+# Sub-unit quotes, e.g. London prices are in pence
+SUBUNITS = {"GBp": ("GBP", 100.0)}
+
+# Chart range -> (stored tier, lookback period, resample rule applied to that tier)
+CHART_RANGES = {
+    "1D": ("intraday", "1d", None),
+    "1W": ("intraday", "5d", "30min"),
+    "1M": ("daily", "1mo", None),
+    "6M": ("daily", "6mo", None),
+    "1Y": ("daily", "1y", "W"),
+    "5Y": ("daily", "5y", "W"),
+    "MAX": ("daily", "max", "W"),
+}
+#endregion
+
+def NativeCurrency(ticker: str) -> str:
+    '''Currency a ticker is quoted in, based on its exchange suffix'''
+    if "." in ticker:
+        return SUFFIX_CURRENCIES.get(ticker[ticker.rindex("."):], "USD")
+    return "USD"
+
+def BaseCurrency(currency: str) -> str:
+    '''Strips sub-unit quotes down to the currency with an FX pair'''
+    return SUBUNITS.get(currency, (currency, 1.0))[0]
+
+class FxMatrix:
+    '''Units of every currency per USD, converts whole arrays in one step'''
+    def __init__(self, rates: dict | None = None):
+        rates = {"USD": 1.0, **(rates or {})}
+        for subunit, (currency, scale) in SUBUNITS.items():
+            if currency in rates: rates[subunit] = rates[currency] * scale
+        self.rates = pd.Series(rates, dtype = float)
+
+    @classmethod
+    def FromQuotes(cls, quotes: pd.Series) -> "FxMatrix":
+        '''Reads every CUR=X column out of a row of closes'''
+        rates = {symbol[:-2]: float(rate) for symbol, rate in quotes.items() if str(symbol).endswith("=X") and not pd.isna(rate)}
+        return cls(rates)
+
+    def Rate(self, currency: str) -> float:
+        '''Units of currency per USD, NaN when the pair is unknown'''
+        return float(self.rates.get(currency, np.nan))
+
+    def Factors(self, currencies: np.ndarray, display: str) -> np.ndarray:
+        '''Per-row multipliers converting native prices into the display currency, NaN where either rate is unknown'''
+        native = self.rates.reindex(currencies).to_numpy(dtype = float)
+        return self.Rate(display) / native
+
+    @staticmethod
+    def HistoryRates(close_data: pd.DataFrame, currencies: list) -> np.ndarray:
+        '''Date x ticker matrix of units per USD taken from the CUR=X columns of a history frame, NaN where the pair is missing'''
+        unique = {currency: BaseCurrency(currency) for currency in set(currencies)}
+        rates = pd.DataFrame(np.nan, index = close_data.index, columns = list(unique))
+        for currency, base in unique.items():
+            if base == "USD":
+                rates[currency] = 1.0
+            elif FxTicker(base) in close_data.columns:
+                rates[currency] = close_data[FxTicker(base)].ffill().bfill() * SUBUNITS.get(currency, (base, 1.0))[1]
+        return rates.reindex(columns = currencies).to_numpy()
+
+class Portfolio:
+    '''GUI-free list of (ticker, quantity) positions in table order'''
+    def __init__(self, positions: list | None = None, currencies: dict | None = None):
+        self.positions = [(ticker.strip().upper(), float(quantity)) for ticker, quantity in (positions or []) if ticker.strip()]
+
+        # explicit currencies win over the exchange suffix
+        currencies = currencies or {}
+        self.currencies = {ticker: currencies.get(ticker, NativeCurrency(ticker)) for ticker in self.tickers}
+
+    @classmethod
+    def FromRows(cls, rows: list) -> "Portfolio":
+        '''Builds a portfolio from sheet rows laid out as [Ticker, Price, Amount, ...]'''
+        positions = []
+        for row in rows:
+            if not row or not str(row[0]).strip(): continue
+            positions.append((str(row[0]), cls.ParseQuantity(row[2]) if len(row) > 2 else 0.0))
+
+        return cls(positions)
+
+    @staticmethod
+    def ParseQuantity(value) -> float:
+        '''Amount cell as a number, blank or unparsable text counts as zero'''
+        try:
+            return float(value or 0)
+        except ValueError:
+            return 0.0
+
+    @property
+    def tickers(self) -> list:
+        '''Unique tickers in first-seen order'''
+        return list(dict.fromkeys(ticker for ticker, _ in self.positions))
+
+    def QuantityMap(self) -> dict:
+        '''Total quantity held per ticker'''
+        quantities = {}
+        for ticker, quantity in self.positions:
+            quantities[ticker] = quantities.get(ticker, 0.0) + quantity
+        return quantities
+
+    def FxSymbols(self) -> list:
+        '''FX pairs needed to convert every holding into any display currency'''
+        needed = set(DISPLAY_CURRENCIES) | {BaseCurrency(currency) for currency in self.currencies.values()}
+        return [FxTicker(currency) for currency in sorted(needed - {"USD"})]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+def FormatRow(price: float, total: float, qty_change: float, pct: float, currency_sym: str = "$") -> tuple:
+    '''Display strings for the Price, Total and Daily Change columns'''
+    return (
+        f"{currency_sym}{price:,.2f}",
+        f"{currency_sym}{total:,.2f}",
+        f"{'+' if qty_change >= 0 else '-'}{currency_sym}{abs(qty_change):,.2f} ({pct:+.2f}%)"
+    )
+
+class Valuation:
+    '''Numbers-only result of pricing a Portfolio, every field is an array aligned by row'''
+    __slots__ = ("tickers", "price", "prev_close", "quantity", "currency", "currency_sym", "rate", "total", "qty_change", "pct", "total_value", "total_change")
+
+    def __init__(self, tickers: np.ndarray, price: np.ndarray, prev_close: np.ndarray, quantity: np.ndarray, currency: str = "USD", rate: float = 1.0):
+        self.tickers = tickers
+        self.price = price
+        self.prev_close = prev_close
+        self.quantity = quantity
+        self.currency = currency
+        self.currency_sym = CURRENCY_SYMBOLS.get(currency, "$")
+        self.rate = rate # units of currency per USD
+
+        self.total = price * quantity
+        self.qty_change = (price - prev_close) * quantity
+        self.pct = (price - prev_close) / prev_close * 100
+
+        # unpriced rows are NaN and left out of the totals
+        self.total_value = float(np.nansum(self.total))
+        self.total_change = float(np.nansum(self.qty_change))
+
+    def SheetRow(self, index: int) -> list:
+        '''[Ticker, Price, Amount, Total, Change] for one row, strings are only built when a row is shown'''
+        if np.isnan(self.price[index]):
+            price_str = total_str = change_str = "n/a"
+        else:
+            price_str, total_str, change_str = FormatRow(self.price[index], self.total[index], self.qty_change[index], self.pct[index], self.currency_sym)
+        return [self.tickers[index], price_str, float(self.quantity[index]), total_str, change_str]
+
+    def Rescale(self, currency: str, rate: float) -> "Valuation":
+        '''Same positions in another currency, a scalar multiply instead of a re-valuation'''
+        factor = rate / self.rate
+        return Valuation(self.tickers, self.price * factor, self.prev_close * factor, self.quantity, currency, rate)
+
+    def Order(self, key: str) -> np.ndarray:
+        '''Row order by a numeric column, largest first, unpriced rows last'''
+        return np.argsort(-getattr(self, key), kind = "stable")
+
+    def Sorted(self, key: str) -> "Valuation":
+        '''Rows reordered by a numeric column, largest first, unpriced rows last'''
+        return self.Take(self.Order(key))
+
+    def Take(self, order: np.ndarray) -> "Valuation":
+        '''Rows picked in the given order'''
+        return Valuation(self.tickers[order], self.price[order], self.prev_close[order], self.quantity[order], self.currency, self.rate)
+
+    def Matches(self, portfolio: "Portfolio") -> bool:
+        '''True when the rows are exactly the portfolio's positions, i.e. the sheet was not edited since this was valued'''
+        return (
+            self.tickers.tolist() == [ticker for ticker, _ in portfolio.positions]
+            and np.array_equal(self.quantity, [quantity for _, quantity in portfolio.positions])
+        )
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+def NearestIndex(sorted_values: np.ndarray, target: float) -> int:
+    '''Index of the closest value in an ascending array, found by binary search'''
+    index = int(np.searchsorted(sorted_values, target))
+    if index == 0: return 0
+    if index == len(sorted_values): return index - 1
+    return index if sorted_values[index] - target < target - sorted_values[index - 1] else index - 1
+
+def Downsample(x: np.ndarray, y: np.ndarray, budget: int) -> np.ndarray:
+    '''Largest-Triangle-Three-Buckets, returns the indices of at most budget points that keep the line shape'''
+    count = len(x)
+    if budget >= count or budget < 3: return np.arange(count)
+
+    # first and last points are always kept, the rest is split into budget - 2 buckets
+    edges = np.linspace(1, count - 1, budget - 1).astype(int)
+    selected = np.empty(budget, dtype = int)
+    selected[0], selected[-1] = 0, count - 1
+
+    anchor = 0
+    for bucket in range(budget - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+
+        # the next bucket's average stands in for the point that will be picked there
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], max(edges[bucket + 2], edges[bucket + 1] + 1)
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor]) - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+
+    return selected
+
+def PreviousCloses(close_data: pd.DataFrame) -> tuple:
+    '''Per ticker (close of the bar before the last one, latest close) found on each ticker's own calendar'''
+    values = close_data.to_numpy(dtype = float)
+    valid = ~np.isnan(values)
+    rows = np.arange(len(values))[:, None]
+    columns = np.arange(values.shape[1])
+
+    # last bar each ticker actually traded, then the last bar before that one
+    last_row = np.where(valid, rows, -1).max(axis = 0)
+    previous_row = np.where(valid & (rows < last_row), rows, -1).max(axis = 0)
+
+    latest = np.where(last_row >= 0, values[last_row, columns], np.nan)
+    previous = np.where(previous_row >= 0, values[previous_row, columns], np.nan)
+    return pd.Series(previous, index = close_data.columns), pd.Series(latest, index = close_data.columns)
+
+def LatestCloses(close_data: pd.DataFrame) -> tuple:
+    '''Per ticker (date of the last bar it traded, latest close), NaT and NaN for a ticker without any close'''
+    values = close_data.to_numpy(dtype = float)
+    rows = np.arange(len(values))[:, None]
+    last_row = np.where(~np.isnan(values), rows, -1).max(axis = 0)
+
+    latest = np.where(last_row >= 0, values[last_row, np.arange(values.shape[1])], np.nan)
+    last_dates = close_data.index[np.maximum(last_row, 0)].where(last_row >= 0)
+    return pd.Series(last_dates, index = close_data.columns), pd.Series(latest, index = close_data.columns)
+
+class FetchPlan:
+    '''Describes the downloads that serve both the quote table and the 1yr chart, one per distinct top-up start'''
+    def __init__(self, portfolio: Portfolio, period: str = "1y", cache: HistoryCache | None = None, skip: list | tuple = ()):
+        self.tickers = portfolio.tickers
+        self.symbols = self.tickers + portfolio.FxSymbols()
+        self.period = period
+        self.cache = cache
+
+        # symbols the last download could not get are left out, so one dead ticker does not cost a full download every time
+        self.skipped = [symbol for symbol in self.symbols if symbol in skip]
+        wanted = [symbol for symbol in self.symbols if symbol not in skip]
+
+        # only bars missing from the cache are requested, the full period only for symbols with no history yet
+        self.starts = cache.TopUpStarts(wanted) if cache else {None: wanted}
+
+    def Fetch(self, provider: MarketDataProvider) -> tuple:
+        '''Downloads what is missing, returns the full period of daily closes and the symbols this download could not get'''
+        history_start = PeriodStart(self.period, pd.Timestamp.today().normalize())
+        frames, failed = [], list(self.skipped)
+
+        for start, symbols in self.starts.items():
+            try:
+                fresh = provider.DailyBars(symbols, period = self.period, prepost = True, start = start)
+            except Exception as e:
+                # e.g. a group holding only a delisted ticker, the other groups still land
+                print(f"Download failed ({len(symbols)} symbols): {e!r}")
+                failed += symbols
+                continue
+
+            failed += MissingTickers(fresh, symbols)
+            frames.append(fresh)
+            if self.cache:
+                self.cache.Write(fresh)
+                if start is None: self.cache.SetCoverage(symbols, history_start)
+
+        if self.starts and not frames: raise RuntimeError("every download failed")
+        if not self.cache: return (pd.concat(frames, axis = 1) if frames else pd.DataFrame()), failed
+
+        self.cache.Touch(self.symbols)
+        return self.cache.Read(self.symbols, history_start), failed
+
+class PriceEngine:
+    '''Fetches market data and values a Portfolio without touching any widgets'''
+    def __init__(self, provider: MarketDataProvider | None = None, cache: HistoryCache | None = None, quote_cache: QuoteCache | None = None):
+        self.provider = provider or YFinanceProvider()
+        self.cache = cache
+        self.quote_cache = quote_cache
+        self.contributions = None # per-ticker value curves from the last history refresh
+        self.fx = FxMatrix()
+        self.last_prices = None # (previous close, latest close) as pandas Series
+        self.failed = []        # symbols the provider could not download on the last refresh
+        self.previous_closes = {} # ticker -> (date of its last bar, previous close), resolved once per session
+        self.lock = threading.Lock()
+
+        # daily tier kept in memory when there is no disk cache
+        self.daily = None
+        self.daily_start = None
+
+    # Update data
+    def Refresh(self, portfolio: Portfolio, chart_range: str = "1Y", token: "FetchToken | None" = None, refetch: bool = False) -> tuple | None:
+        '''Fetches quotes and 1yr history in one request, returns the chart_range history of the portfolio'''
+        if not portfolio: return None
+
+        # timed refreshes must download, whatever the quote cache still holds
+        if refetch and self.quote_cache: self.quote_cache.Invalidate()
+
+        # failures travel with the download they belong to, a cache hit reports the ones of the download it serves
+        # timed refreshes skip the symbols that failed last time, an Update or edit tries them again
+        plan = FetchPlan(portfolio, cache = self.cache, skip = self.failed if refetch else ())
+        if self.quote_cache:
+            daily, failed = self.quote_cache.Get((tuple(plan.symbols), plan.period), lambda: plan.Fetch(self.provider))
+        else:
+            daily, failed = plan.Fetch(self.provider)
+
+        # a newer refresh superseded this one while it was downloading, keep its results
+        with self.lock:
+            if token is not None and token.Stale(): return None
+            self.ApplyQuotes(daily)
+            self.daily, self.daily_start = daily, PeriodStart(plan.period, pd.Timestamp.today().normalize())
+            self.failed = failed
+
+        return self.History(portfolio, chart_range)
+
+    def Warm(self, portfolio: Portfolio) -> tuple | None:
+        '''Values the portfolio from the history cache alone, returns the 1Y history so the last session shows before any download'''
+        if not portfolio or not self.cache: return None
+
+        symbols = portfolio.tickers + portfolio.FxSymbols()
+        daily = self.cache.Read(symbols, PeriodStart("1y", pd.Timestamp.today().normalize()))
+        if daily.empty: return None
+
+        with self.lock:
+            # a refresh that already landed is newer than anything on disk
+            if self.last_prices is not None: return None
+            self.ApplyQuotes(daily)
+
+        return self.AggregateHistory(ResampleWeekly(daily), portfolio)
+
+    def Snapshot(self, history: tuple | None, chart_range: str) -> dict | None:
+        '''Current quotes, exchange rates and chart curve as plain arrays for PriceSnapshot'''
+        if self.last_prices is None: return None
+
+        previous, latest = self.last_prices
+        dates, values = (history[0], history[1]) if history is not None else ([], [])
+        dates = pd.DatetimeIndex(dates)
+        if dates.tz is not None: dates = dates.tz_localize(None) # intraday bars keep their exchange wall time
+
+        return {
+            "symbols": previous.index.to_numpy(dtype = str),
+            "previous": previous.to_numpy(dtype = float),
+            "latest": latest.reindex(previous.index).to_numpy(dtype = float),
+            "fx_currencies": self.fx.rates.index.to_numpy(dtype = str),
+            "fx_rates": self.fx.rates.to_numpy(dtype = float),
+            "dates": dates.to_numpy(dtype = "datetime64[ns]"),
+            "values": np.asarray(values, dtype = float),
+            "chart_range": np.array(chart_range),
+        }
+
+    def Restore(self, snapshot: dict) -> tuple | None:
+        '''Reinstates snapshot quotes unless fresher ones already landed, returns the saved (dates, values, chart_range)'''
+        with self.lock:
+            if self.last_prices is not None: return None
+
+            symbols = snapshot["symbols"].tolist()
+            self.last_prices = (pd.Series(snapshot["previous"], index = symbols), pd.Series(snapshot["latest"], index = symbols))
+            self.fx = FxMatrix(dict(zip(snapshot["fx_currencies"].tolist(), snapshot["fx_rates"].tolist())))
+
+        return pd.DatetimeIndex(snapshot["dates"]), snapshot["values"], str(snapshot["chart_range"])
+
+    def History(self, portfolio: Portfolio, chart_range: str = "1Y") -> tuple | None:
+        '''(dates, values, contributions) over a chart range, served locally whenever the tier already covers it'''
+        if not portfolio: return None
+
+        tier, period, rule = CHART_RANGES[chart_range]
+        symbols = portfolio.tickers + portfolio.FxSymbols()
+        closes = self.IntradayHistory(symbols) if tier == "intraday" else self.DailyHistory(symbols, period)
+        if closes.empty: return None
+
+        # slice the lookback from the newest bar, then derive the coarser resolution
+        start = PeriodStart(period, closes.index[-1])
+        if start is not None: closes = closes[closes.index > start]
+        if rule == "W":
+            closes = ResampleWeekly(closes)
+        elif rule:
+            closes = closes.resample(rule).last().dropna(how = "all")
+
+        return self.AggregateHistory(closes, portfolio)
+
+    def DailyHistory(self, symbols: list, period: str) -> pd.DataFrame:
+        '''Daily closes back to the period start, only downloading when the stored tier is too short'''
+        start = PeriodStart(period, pd.Timestamp.today().normalize())
+
+        if self.cache:
+            if not self.cache.Covers(symbols, start):
+                self.cache.Write(self.provider.DailyBars(symbols, period = period))
+                self.cache.SetCoverage(symbols, start)
+                self.cache.Touch(symbols)
+            return self.cache.Read(symbols, start)
+
+        if self.daily is None or (self.daily_start is not None and (start is None or start < self.daily_start)):
+            self.daily, self.daily_start = self.provider.DailyBars(symbols, period = period), start
+
+        # tickers whose download failed are simply absent
+        daily = self.daily.reindex(columns = [symbol for symbol in symbols if symbol in self.daily.columns])
+        return daily if start is None else daily[daily.index >= start]
+
+    def IntradayHistory(self, symbols: list) -> pd.DataFrame:
+        '''5 minute closes for the last five sessions, shared through the quote cache TTL'''
+        loader = lambda: self.provider.IntradayBars(symbols, period = "5d", interval = "5m")
+        if self.quote_cache: return self.quote_cache.Get(("intraday", tuple(symbols)), loader)
+        return loader()
+
+    def ApplyQuotes(self, close_data: pd.DataFrame) -> None:
+        '''Stores the latest and previous closes and the exchange rates'''
+        last_dates, latest = LatestCloses(close_data)
+
+        # a previous close only moves once a bar for a new session lands, intraday refreshes reuse it
+        resolve = [ticker for ticker, date in last_dates.items() if pd.isna(date) or self.previous_closes.get(ticker, (None,))[0] != date]
+        if resolve:
+            previous, _ = PreviousCloses(close_data[resolve])
+            self.previous_closes.update({ticker: (last_dates[ticker], previous[ticker]) for ticker in resolve})
+
+        previous = pd.Series([self.previous_closes[ticker][1] for ticker in close_data.columns], index = close_data.columns, dtype = float)
+        self.last_prices = (previous, latest)
+        self.fx = FxMatrix.FromQuotes(latest)
+
+    def AggregateHistory(self, close_data: pd.DataFrame, portfolio: Portfolio) -> tuple | None:
+        '''Weights the USD close matrix by the quantity vector, returns (dates, values, per-ticker contributions)'''
+        quantities = pd.Series(portfolio.QuantityMap())
+        quantities = quantities[quantities.index.isin(close_data.columns)]
+        if quantities.empty: return None
+
+        # holdings whose currency has no FX pair in the download are left out rather than counted as USD
+        rates = FxMatrix.HistoryRates(close_data, [portfolio.currencies[ticker] for ticker in quantities.index])
+        converted = ~np.isnan(rates).any(axis = 0)
+        quantities, rates = quantities[converted], rates[:, converted]
+        if quantities.empty: return None
+
+        # gaps after listing carry the last close forward, dates before listing count as $0
+        closes = close_data[quantities.index].ffill().fillna(0).to_numpy(dtype = float) / rates
+        contributions = closes * quantities.to_numpy()
+        values = closes @ quantities.to_numpy()
+
+        self.contributions = pd.DataFrame(contributions, index = close_data.index, columns = quantities.index)
+        return close_data.index, values, self.contributions
+
+    # Valuation
+    def Rate(self, currency: str) -> float:
+        '''Conversion factor from USD into the requested display currency'''
+        return self.fx.Rate(currency)
+
+    def Valuate(self, portfolio: Portfolio, currency: str = "USD") -> Valuation:
+        '''Prices every position at once in the display currency, tickers with missing or corrupted prices stay as NaN rows'''
+        tickers = np.array([ticker for ticker, _ in portfolio.positions], dtype = object)
+        quantity = np.array([quantity for _, quantity in portfolio.positions], dtype = float)
+        natives = np.array([portfolio.currencies[ticker] for ticker in tickers], dtype = object)
+        rate = self.Rate(currency)
+
+        if self.last_prices is None or len(tickers) == 0:
+            empty = np.empty(0)
+            return Valuation(tickers[:0], empty, empty, empty, currency, rate)
+
+        prev_prices, current_prices = self.last_prices
+        current = current_prices.reindex(tickers).to_numpy(dtype = float)
+        prev = prev_prices.reindex(tickers).to_numpy(dtype = float)
+
+        factors = self.fx.Factors(natives, currency)
+
+        # an unpriced row is kept so the table and the saved portfolio never lose the position, a row without an FX rate is unpriced too
+        valid = ~np.isnan(current) & ~np.isnan(prev) & (prev != 0) & ~np.isnan(factors)
+        current = np.where(valid, current * factors, np.nan)
+        prev = np.where(valid, prev * factors, np.nan)
+        return Valuation(tickers, current, prev, quantity, currency, rate)
+
+def RefreshInterval(open_interval: float, closed_interval: float | None) -> float | None:
+    '''Seconds until the next automatic refresh, None when refreshing should stop while markets are closed'''
+    return open_interval if MarketOpen() else closed_interval
+
+class FetchToken:
+    '''Generation stamp handed to a job, it goes stale once a newer job of the same kind is submitted'''
+    def __init__(self, pipeline: "FetchPipeline", kind: str, generation: int):
+        self.pipeline = pipeline
+        self.kind = kind
+        self.generation = generation
+        self.expired = False # set once the job outlives the pipeline timeout
+
+    def Superseded(self) -> bool:
+        '''True once a newer job of the same kind has been submitted'''
+        return self.pipeline.generations.get(self.kind) != self.generation
+
+    def Stale(self) -> bool:
+        '''True when the job's results should be dropped, superseded or timed out'''
+        return self.expired or self.Superseded()
+
+class FetchPipeline:
+    '''asyncio loop on its own thread running blocking fetches with bounded concurrency, timeouts and supersession'''
+    def __init__(self, max_concurrency: int = 4, timeout: float = 120.0):
+        self.timeout = timeout     # seconds before a job's results are given up on, providers time out each request well before
+        self.generations = {}      # kind -> newest generation submitted
+        self.tasks = {}            # kind -> future of the newest job
+        self.lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.thread = threading.Thread(target = self.loop.run_forever, daemon = True)
+        self.thread.start()
+
+    def Submit(self, kind: str, function, *args, on_done = None) -> FetchToken:
+        '''Runs function(*args, token) and cancels any older job of the same kind, on_done(token, error) fires once'''
+        token = self.Invalidate(kind)
+        future = asyncio.run_coroutine_threadsafe(self.Run(token, function, args, on_done), self.loop)
+
+        with self.lock:
+            self.tasks[kind] = future
+        return token
+
+    def Invalidate(self, kind: str) -> FetchToken:
+        '''Makes every running job of kind stale and cancels it where it is still waiting'''
+        with self.lock:
+            generation = self.generations.get(kind, 0) + 1
+            self.generations[kind] = generation
+            previous = self.tasks.pop(kind, None)
+
+        if previous: previous.cancel()
+        return FetchToken(self, kind, generation)
+
+    def Busy(self, kind: str) -> bool:
+        '''True while the newest job of kind has not finished, including a timed out job whose thread is still running'''
+        with self.lock:
+            future = self.tasks.get(kind)
+        return future is not None and not future.done()
+
+    async def Run(self, token: FetchToken, function, args: tuple, on_done = None) -> None:
+        '''Waits for a concurrency slot, then runs the blocking job in a thread'''
+        error = None
+        try:
+            async with self.semaphore:
+                if token.Stale(): return
+                worker = asyncio.ensure_future(asyncio.to_thread(function, *args, token))
+                try:
+                    await asyncio.wait_for(asyncio.shield(worker), self.timeout)
+                except asyncio.TimeoutError as e:
+                    # a thread cannot be stopped, expire its token so nothing it still produces is applied
+                    token.expired = True
+                    if on_done: on_done(token, e)
+                    on_done = None
+
+                    # the slot and Busy() stay held until the thread really returns
+                    await asyncio.gather(worker, return_exceptions = True)
+        except Exception as e:
+            error = e
+        finally:
+            if on_done: on_done(token, error)
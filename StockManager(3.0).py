@@ -1,21 +1,24 @@
 #region IMPORTS + SETTINGS
 
 # standard imports
-import json
-import threading
-from ctypes import byref, c_int, sizeof, windll
+import queue
+from typing import Callable, NamedTuple
+
+try:
+    from ctypes import byref, c_int, sizeof, windll
+except ImportError:
+    pass
 
 # Third party libraries
 import customtkinter as ctk
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-import yfinance as yf
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.ticker import MaxNLocator
 from tksheet import Sheet
 
+# Local modules
+from StockEngine import CHART_RANGES, DISPLAY_CURRENCIES, Downsample, NearestIndex, Portfolio, FetchPipeline, FetchToken, PriceEngine, RefreshInterval, Valuation
+from StockProviders import ChunkedProvider, MarketDataProvider, YFinanceProvider
+from StockStore import HistoryCache, PortfolioDatabase, PriceSnapshot, QuoteCache
+
 # General Theme (Softer, Dusty Blues)
 THEME_TOP = "#33475d" # R G B
 THEME_MAIN = "#475e75"        
@@ -34,10 +37,67 @@ WHITE = "#DFDFDF"
 
 SOFT_GREEN = "#00C805" # Vibrant but clean
 SOFT_RED = "#FF3B30"   # Sharp but professional
+NO_PRICE = "#6B7280"   # rows the last download could not price
+
+# Auto refresh (seconds), None while closed stops fetching until the market opens again
+AUTO_REFRESH_OPEN = 60
+AUTO_REFRESH_CLOSED = 1800
+MARKET_CHECK = 300
+
+# How often the Tk loop drains worker results (ms)
+UI_DRAIN_MS = 50
+
+# Delay before the first network fetch, the window and cached values paint first (ms)
+STARTUP_FETCH_DELAY = 250
+
+# Table virtualization, rows formatted either side of the viewport and how often the scroll position is checked (ms)
+OVERSCAN_ROWS = 20
+VIEWPORT_POLL_MS = 50
 #endregion
 
-class App(ctk.CTk):
+#region EVENTS
+class PricesReady(NamedTuple):
+    '''Engine holds new quotes, the table should be re-valued'''
+    fresh: bool = True # False while the quotes are still the last session's cached closes
+    failed: tuple = () # symbols the refresh could not download
+
+class HistoryReady(NamedTuple):
+    '''New chart series for a range'''
+    dates: object
+    values: object
+    chart_range: str
+
+class FetchFinished(NamedTuple):
+    '''A refresh ended, successfully or not'''
+
+class UiQueue:
+    '''Worker threads publish events here, only the Tk main loop consumes them'''
     def __init__(self):
+        self.events = queue.SimpleQueue()
+
+    def Publish(self, event: NamedTuple) -> None:
+        '''Thread-safe, callable from any worker'''
+        self.events.put(event)
+
+    def Drain(self) -> list:
+        '''Everything published since the last drain, keeping only the newest event of each type'''
+        latest = {}
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            # a fresh price update must survive being coalesced with a later cached one
+            previous = latest.pop(type(event), None)
+            if isinstance(event, PricesReady) and isinstance(previous, PricesReady) and previous.fresh and not event.fresh:
+                event = previous
+            latest[type(event)] = event
+        return list(latest.values())
+#endregion
+
+class App(ctk.CTk):
+    def __init__(self, provider: MarketDataProvider | None = None):
         # setup
         super().__init__(fg_color = THEME_TOP)
         self.title("Stock Manager")
@@ -45,22 +105,36 @@ class App(ctk.CTk):
         self.minsize(525,350)
         self.ChangeTitleBar()
 
-        self.exchange_rate = 1.0
-        self.last_prices = (None, None)
+        self.engine = PriceEngine(ChunkedProvider(provider or YFinanceProvider()), HistoryCache(), QuoteCache())
+        self.pipeline = FetchPipeline()
+        self.ui_queue = UiQueue()
+        self.store = PortfolioDatabase()
+        self.snapshot = PriceSnapshot()
+        self.stale = True # shown prices are cached until a refresh lands
+        self.failed = ()  # symbols missing from the last refresh
 
         # widgets
         self.CreateFrames()
         self.LoadData()
+        self.main_frame.sheet.extra_bindings([
+            ("end_edit_cell", self.OnSheetEdit),
+            ("end_paste", self.OnSheetEdit),
+            ("end_cut", self.OnSheetEdit),
+            ("end_undo", self.OnSheetEdit),
+            ("end_delete_rows", self.OnSheetEdit)
+        ])
 
         # detection
         self.protocol("WM_DELETE_WINDOW", self.OnClose)
+        self.after(AUTO_REFRESH_OPEN * 1000, self.AutoRefresh)
+        self.after(UI_DRAIN_MS, self.DrainEvents)
     
     def CreateFrames(self) -> None:
         '''Adds frame widgets onto window'''
         self.control_frame = ControlFrame(self, self.AddRowCallback, self.UpdateCallback, self.ResetCallback, self.ToggleCallback, self.SortCallback)
         self.control_frame.place(relx = 0, rely = 0, relwidth = 1.0, relheight = 0.15)
 
-        self.graph_frame = GraphFrame(self)
+        self.graph_frame = GraphFrame(self, self.RangeCallback)
         self.graph_frame.place(relx = 0.6, rely = 0.15, relwidth = 0.4, relheight = 0.85)
 
         self.main_frame = MainFrame(self)
@@ -76,152 +150,158 @@ class App(ctk.CTk):
 
     def SortCallback(self, metric: str) -> None:
         '''Called to sort data by specificed metric'''
-        if not hasattr(self.main_frame, "raw_data") or not self.main_frame.raw_data:
+        if self.main_frame.valuation is None or not len(self.main_frame.valuation):
             print("No data available to sort yet. Please update prices first.")
             return
-        
+
+        # rows are moved as they are in the sheet, so value any edits made since the last refresh first
+        if not self.ValuationCurrent(): self.ApplyPricesToUI()
         self.main_frame.SortData(metric)
 
     def ResetCallback(self) -> None:
         '''Triggered to clear all rows'''
+        self.main_frame.valuation = None
+        self.main_frame.cell_colours = {}
         self.main_frame.sheet.set_sheet_data(data = [])
         self.main_frame.AddRow()
-        self.main_frame.DynamicTableResize(None)
+        self.main_frame.DynamicTableResize(None, force = True)
         self.main_frame.sheet.redraw()
 
-    def ToggleCallback(self) -> None:
-        '''Called when switch is flipped or for fresh data'''
-        if self.last_prices is None: return
+    def ToggleCallback(self, currency: str | None = None) -> None:
+        '''Called when the display currency changes, rescales what is shown unless the sheet was edited since'''
+        valuation = self.main_frame.valuation
+        if valuation is None: return
+
+        currency = currency or self.control_frame.currency_var.get()
+        rate = self.engine.Rate(currency)
+        if np.isnan(rate):
+            # without a rate every row would be unpriced, stay on the currency already shown
+            print(f"No {currency} exchange rate downloaded yet, keeping {valuation.currency}.")
+            self.control_frame.currency_var.set(valuation.currency)
+            return
 
-        is_nzd = self.control_frame.currency_var.get() == "NZD"
-        multiplier = self.exchange_rate if is_nzd else 1.0
+        # an edit whose refresh has not landed yet would be reverted by the older valuation
+        if not self.ValuationCurrent():
+            self.ApplyPricesToUI()
+            return
 
-        self.ApplyPricesToUI(self.last_prices[0], self.last_prices[1], multiplier)
+        self.ShowValuation(valuation.Rescale(currency, rate))
 
-    def UpdateCallback(self) -> None:
-        '''Single entry point to trigger the background update chain'''
-        self.control_frame.button_update.configure(state = "disabled", text = "Fetching..")
-        table_data = self.main_frame.GetTableData()
-        tickers = [row[0].strip().upper() for row in table_data if row[0].strip()]
-        
-        if not tickers: return
+    def ValuationCurrent(self) -> bool:
+        '''True when the shown valuation still matches the tickers and amounts in the sheet'''
+        valuation = self.main_frame.valuation
+        return valuation is not None and valuation.Matches(Portfolio.FromRows(self.main_frame.GetTableData()))
 
-        # Start ONE thread that handles the entire sequence
-        threading.Thread(target = self.SequentialUpdateTask, args = (tickers, table_data), daemon = True).start()
+    def RangeCallback(self, chart_range: str) -> None:
+        '''Called when a chart range button is pressed, history is served from local tiers when possible'''
+        portfolio = Portfolio.FromRows(self.main_frame.GetTableData())
+        if not portfolio or self.engine.last_prices is None: return
 
-    # Update data and apply
-    def FetchPrices(self, tickers: list) -> None:
-        '''Background task to fetch data and update UI'''
-        try:
-            # retrieves most recent data
-            data = yf.download(tickers + ["NZD=X"], period = "7d", interval = "1d", progress = False, prepost = True)
-            close_data = data['Close'].ffill().bfill()
+        self.pipeline.Submit("chart", self.ChartTask, portfolio, chart_range)
+
+    def UpdateCallback(self, refetch: bool = False) -> None:
+        '''Single entry point to trigger the background update chain, refetch skips the quote cache'''
+        portfolio = Portfolio.FromRows(self.main_frame.GetTableData())
+        if not portfolio: return
 
-            # 2. Assign the rows
-            index = -1
-            while close_data.iloc[index][tickers[0]] == close_data.iloc[index - 1][tickers[0]]:
-                index -= 1
+        # a newer update supersedes any fetch still in flight, and the cached warm-up it would overwrite
+        self.pipeline.Invalidate("warm")
+        self.pipeline.Submit("refresh", self.UpdateTask, portfolio, self.graph_frame.range_var.get(), refetch, on_done = self.OnFetchDone)
+        self.control_frame.button_update.configure(state = "disabled", text = "Fetching..")
 
-            self.last_prices = (close_data.iloc[index - 1], close_data.iloc[-1])
-            self.exchange_rate = float(self.last_prices[1]["NZD=X"])
+    def OnFetchDone(self, token: FetchToken, error: BaseException | None) -> None:
+        '''Runs on the pipeline thread once a refresh job ends, timed out or cancelled'''
+        if error is not None: print(f"Error fetching data: {error!r}")
+        if not token.Superseded(): self.ui_queue.Publish(FetchFinished())
 
-            self.after(0, lambda: self.ToggleCallback())
-        except Exception as e:
-            print(f"Error fetching data: {e}")
+    def OnSheetEdit(self, event = None) -> None:
+        '''Table edits are saved straight away and make in-flight results stale, so fetch again for the new rows'''
+        self.SaveData()
+        self.UpdateCallback()
 
-    def FetchHistoricalData(self, portfolio_map: dict) -> None:
-        '''Fetches 1yr history and calculates performance'''
-        try:
-            # grab and filter data
-            tickers = list(portfolio_map.keys())
-            data = yf.download(tickers, period="1y", interval="1wk", progress=False)
-            
-            if 'Close' in data:
-                close_data = data['Close']
-            else:
-                close_data = data
-                
-            close_data = close_data.ffill().bfill()
-            total_history = None
-            
-            for ticker, qty in portfolio_map.items():
-                if ticker in close_data.columns:
-                    # fillna(0) ensures that if a stock didn't exist yet, it just counts as $0 
-                    series = close_data[ticker].fillna(0) * qty
-                    if total_history is None:
-                        total_history = series
-                    else:
-                        total_history = total_history.add(series, fill_value=0)
-
-            if total_history is not None:
-                # updates graph 
-                dates = total_history.index
-                values = total_history.values
-                self.after(0, lambda: self.graph_frame.UpdateChart(dates, values))             
-        except Exception as e:
-            print(f"Graph Error Logic: {e}") 
-        
-        # reactivate update button
-        self.control_frame.button_update.configure(state = "normal", text = "Update")
-
-    def SequentialUpdateTask(self, tickers: dict, table_data: dict) -> None:
-        '''Guarantees that Table finishes before Graph starts to avoid yfinance collisions'''
-        self.FetchPrices(tickers) 
-        portfolio_map = {row[0].strip().upper(): float(row[2] or 0) for row in table_data if row[0].strip()}
-        if portfolio_map:
-            self.FetchHistoricalData(portfolio_map)
-
-    def ApplyPricesToUI(self, prev_prices: dict, current_prices: dict, multiplier: float = 1.0) -> None:
-        '''Updates the UI safely, skipping corrupted data to prevent NaN/zeroing errors.'''
-        total_value = 0.0
-        total_change = 0.0
-        currency_sym = "NZ$" if multiplier != 1.0 else "$"
-        
-        table_data = self.main_frame.GetTableData()
-        new_raw_data = [] 
+    def AutoRefresh(self) -> None:
+        '''Timer tick refreshing prices on a cadence that follows the market hours'''
+        interval = RefreshInterval(AUTO_REFRESH_OPEN, AUTO_REFRESH_CLOSED)
+        # the cadence matches the quote cache lifetime, so a tick always downloads rather than re-applying cached prices
+        if interval is not None and not self.pipeline.Busy("refresh"):
+            self.UpdateCallback(refetch = True)
 
-        for row in table_data:
-            ticker = row[0].strip().upper() 
-            
-            if ticker in current_prices and ticker in prev_prices:
-                # ensure data is present 
-                p_curr = current_prices[ticker]
-                p_prev = prev_prices[ticker]
-                
-                if pd.isna(p_curr) or pd.isna(p_prev) or p_prev == 0:
-                    continue 
+        self.after(int((interval or MARKET_CHECK) * 1000), self.AutoRefresh)
 
-                price = p_curr * multiplier
-                prev_close = p_prev * multiplier
-                
-                try:
-                    quantity = float(row[2] or 0)
-                except ValueError:
-                    quantity = 0.0
-
-                # sorta daa
-                change_percent = ((price - prev_close) / prev_close) * 100
-                quantity_change = (price - prev_close) * quantity
-                row_total = price * quantity
-                
-                new_raw_data.append({
-                    'ticker': ticker,
-                    'price': price,
-                    'quantity': quantity,
-                    'total': row_total,
-                    'pct': change_percent,
-                    'qty_change': quantity_change,
-                    'price_str': f"{currency_sym}{price:,.2f}",
-                    'total_str': f"{currency_sym}{row_total:,.2f}",
-                    'change_str': f"{'+' if quantity_change >= 0 else '-'}{currency_sym}{abs(quantity_change):,.2f} ({change_percent:+.2f}%)"
-                })
-
-                total_value += row_total
-                total_change += quantity_change
-
-        self.main_frame.raw_data = new_raw_data
-        self.main_frame.SyncSheetWithRaw()
-        self.summary_frame.UpdateSummary(total_value, total_change)
+    # Update data and apply
+    def UpdateTask(self, portfolio: Portfolio, chart_range: str, refetch: bool, token: FetchToken) -> None:
+        '''Background task fetching quotes and 1yr history from a single download'''
+        history = self.engine.Refresh(portfolio, chart_range, token, refetch)
+        if token.Stale(): return
+        self.ui_queue.Publish(PricesReady(failed = tuple(self.engine.failed)))
+        self.snapshot.Save(**self.engine.Snapshot(history, chart_range))
+
+        if history is not None:
+            # updates graph 
+            dates, values, _ = history
+            self.ui_queue.Publish(HistoryReady(dates, values, chart_range))
+
+    def WarmTask(self, portfolio: Portfolio, token: FetchToken) -> None:
+        '''Background task showing the last session's cached values before anything is downloaded'''
+        history = self.engine.Warm(portfolio)
+        if history is None or token.Stale(): return
+        self.ui_queue.Publish(PricesReady(fresh = False))
+
+        dates, values, _ = history
+        self.ui_queue.Publish(HistoryReady(dates, values, "1Y"))
+
+    def ChartTask(self, portfolio: Portfolio, chart_range: str, token: FetchToken) -> None:
+        '''Background task redrawing the chart for another range'''
+        try:
+            history = self.engine.History(portfolio, chart_range)
+            if history is not None and not token.Stale():
+                dates, values, _ = history
+                self.ui_queue.Publish(HistoryReady(dates, values, chart_range))
+        except Exception as e:
+            print(f"Graph Error Logic: {e}")
+
+    def DrainEvents(self) -> None:
+        '''Applies worker results on the Tk thread, a burst of updates becomes one repaint'''
+        for event in self.ui_queue.Drain():
+            if isinstance(event, PricesReady):
+                if event.fresh:
+                    self.stale = False
+                    self.failed = event.failed
+                    if self.failed: print(f"Could not download: {', '.join(self.failed)}")
+                self.ApplyPricesToUI()
+            elif isinstance(event, HistoryReady):
+                # a refresh started before the range changed still carries the old range's curve
+                chart_range = self.graph_frame.range_var.get()
+                if event.chart_range != chart_range:
+                    # the range button may have been pressed before any prices existed, nothing is drawing it yet
+                    if self.graph_frame.chart_range != chart_range and not self.pipeline.Busy("chart"): self.RangeCallback(chart_range)
+                    continue
+                self.graph_frame.UpdateChart(event.dates, event.values, event.chart_range)
+            elif isinstance(event, FetchFinished):
+                self.control_frame.button_update.configure(state = "normal", text = "Update")
+
+        self.after(UI_DRAIN_MS, self.DrainEvents)
+
+    def ApplyPricesToUI(self) -> None:
+        '''Values the current sheet through the engine and pushes the result to the UI'''
+        if self.engine.last_prices is None: return
+
+        portfolio = Portfolio.FromRows(self.main_frame.GetTableData())
+        self.ShowValuation(self.engine.Valuate(portfolio, self.DisplayCurrency()))
+
+    def DisplayCurrency(self) -> str:
+        '''Selected display currency, switched back to USD when the last download has no rate for it'''
+        currency = self.control_frame.currency_var.get()
+        if np.isnan(self.engine.Rate(currency)):
+            print(f"No {currency} exchange rate in the last download, showing USD.")
+            self.control_frame.currency_var.set("USD")
+            return "USD"
+        return currency
+
+    def ShowValuation(self, valuation: Valuation) -> None:
+        '''Pushes a valuation to the table and the summary'''
+        self.main_frame.SetValuation(valuation)
+        self.summary_frame.UpdateSummary(valuation.total_value, valuation.total_change, valuation.currency_sym, self.stale, len(self.failed))
 
     # Data persistence functions
     def OnClose(self) -> None:
@@ -233,50 +313,45 @@ class App(ctk.CTk):
         self.destroy()
 
     def SaveData(self) -> None:
-        '''Extract tickers and quantity from tksheet'''
-        raw_data = self.main_frame.sheet.get_sheet_data()
-        
-        saved_data = []
-        for row in raw_data:
-            if row and len(row) > 0 and str(row[0]).strip():
-                saved_data.append({
-                    "ticker": str(row[0]).strip().upper(),
-                    "amount": str(row[2]).strip()
-                })
-                
-        with open("portfolio.json", "w") as file:
-            json.dump(saved_data, file, indent = 4)
+        '''Stores tickers and quantities from tksheet, quantity changes are recorded at the latest known price'''
+        portfolio = Portfolio.FromRows(self.main_frame.sheet.get_sheet_data())
+        prices = self.engine.last_prices[1].to_dict() if self.engine.last_prices is not None else None
+        self.store.Save([(ticker.strip().upper(), quantity) for ticker, quantity in portfolio.positions], prices)
 
     def LoadData(self) -> None:
         '''Extracts saved data and populates tksheet'''
+        # [Ticker, Price (R), Amount, Total (R), Change(R)]
+        new_sheet_data = [[ticker, "$0.00", quantity, "$0.00", "0.00%"] for ticker, quantity in self.store.Load()]
+
+        # Replace existing sheet data with the new list
+        if new_sheet_data:
+            self.main_frame.sheet.set_sheet_data(new_sheet_data)
+            self.main_frame.sheet.redraw()
+
+            # cached values first, the network fetch waits until the window has painted
+            self.RestoreSnapshot()
+            self.pipeline.Submit("warm", self.WarmTask, Portfolio.FromRows(new_sheet_data))
+            self.after(STARTUP_FETCH_DELAY, self.UpdateCallback)
+        else:
+            self.ResetCallback()
+
+    def RestoreSnapshot(self) -> None:
+        '''Queues the last session's prices and chart so they show on the first drain, marked stale'''
+        snapshot = self.snapshot.Load()
+        if snapshot is None: return
+
         try:
-            with open("portfolio.json", "r") as file:
-                saved_data = json.load(file)
-
-            new_sheet_data = []
-            for item in saved_data:
-                # [Ticker, Price (R), Amount, Total (R), Change(R)]
-                row = [
-                    item["ticker"], 
-                    "$0.00",        
-                    item["amount"], 
-                    "$0.00",        
-                    "0.00%"        
-                ]
-                new_sheet_data.append(row)
-            
-            # Replace existing sheet data with the new list
-            if new_sheet_data:
-                self.main_frame.sheet.set_sheet_data(new_sheet_data)
-                self.main_frame.sheet.redraw()
-                
-                self.UpdateCallback()
-            else:
-                self.ResetCallback()
-                
-        except (FileNotFoundError, json.JSONDecodeError, TypeError):
-            # Called on empty file
-            self.main_frame.AddRow()
+            restored = self.engine.Restore(snapshot)
+        except (KeyError, ValueError) as e:
+            print(f"Ignoring unreadable price snapshot: {e!r}")
+            return
+        if restored is None: return
+
+        # reopen on the range the curve was saved for
+        dates, values, chart_range = restored
+        if chart_range in CHART_RANGES: self.graph_frame.range_var.set(chart_range)
+        self.ui_queue.Publish(PricesReady(fresh = False))
+        self.ui_queue.Publish(HistoryReady(dates, values, chart_range))
 
     # Aesthetics 
     def ChangeTitleBar(self) -> None:
@@ -290,6 +365,32 @@ class App(ctk.CTk):
             pass
 
 #region FRAMES
+class LayoutScheduler:
+    '''Collapses a burst of <Configure> events into a single layout pass per frame'''
+    def __init__(self, widget, callback, delay_ms: int = 16):
+        self.widget = widget
+        self.callback = callback
+        self.delay_ms = delay_ms
+        self.pending_event = None
+        self.after_id = None
+        self.last_size = None
+
+    def Schedule(self, event) -> None:
+        '''Bound to <Configure>, keeps only the newest event until the next frame'''
+        self.pending_event = event
+        if self.after_id is None:
+            self.after_id = self.widget.after(self.delay_ms, self.Flush)
+
+    def Flush(self) -> None:
+        '''Runs the layout callback once, skipping it if the size did not change'''
+        self.after_id = None
+        event = self.pending_event
+        size = (event.width, event.height)
+
+        if size == self.last_size: return
+        self.last_size = size
+        self.callback(event)
+
 class SummaryFrame(ctk.CTkFrame):
     def __init__(self, parent, **kwargs):
         super().__init__(parent, fg_color = THEME_MAIN, corner_radius = 0, **kwargs)
@@ -309,7 +410,9 @@ class SummaryFrame(ctk.CTkFrame):
             text_color = "gray"
         )
         self.change_label.pack(expand = True, pady = (0, 10)) 
-        self.bind("<Configure>", self.RescaleText)
+        self.font_sizes = None
+        self.layout = LayoutScheduler(self, self.RescaleText)
+        self.bind("<Configure>", self.layout.Schedule)
     
     def RescaleText(self, event):
         '''Calculates and updates font sizes based on frame width'''
@@ -318,13 +421,19 @@ class SummaryFrame(ctk.CTkFrame):
         total_font_size = max(14, int(combined_metric / 25)) 
         change_font_size = max(10, int(combined_metric / 50))
 
+        if (total_font_size, change_font_size) == self.font_sizes: return
+        self.font_sizes = (total_font_size, change_font_size)
+
         # Apply new sizes
         self.total_label.configure(font = ("Helvetica", total_font_size, "bold"))
         self.change_label.configure(font = ("Helvetica", change_font_size, "bold"))
     
-    def UpdateSummary(self, total_amount: float, change: float):
-        '''Method to modify total and conigure profit/loss'''
-        self.total_label.configure(text = f"Total: ${total_amount:,.2f}")
+    def UpdateSummary(self, total_amount: float, change: float, currency_sym: str = "$", stale: bool = False, failed: int = 0):
+        '''Method to modify total and conigure profit/loss, stale totals come from the last session and are greyed out'''
+        self.total_label.configure(
+            text = f"Total: {currency_sym}{total_amount:,.2f}" + (" (last session)" if stale else ""),
+            text_color = "gray70" if stale else "white"
+        )
 
         # change label config
         colour = SOFT_GREEN if change >= 0 else SOFT_RED
@@ -332,7 +441,7 @@ class SummaryFrame(ctk.CTkFrame):
         prefix_value = "+" if change >= 0 else "-"
         percent = (change / (total_amount - change) * 100) if total_amount != change else 0
         self.change_label.configure(
-            text = f"Day Change: {prefix_value}${abs(change):,.2f} ({prefix}{percent:.2f}%)", 
+            text = f"Day Change: {prefix_value}{currency_sym}{abs(change):,.2f} ({prefix}{percent:.2f}%)" + (f" · {failed} not updated" if failed else ""), 
             text_color = colour
         )
 
@@ -342,7 +451,11 @@ class MainFrame(ctk.CTkFrame):
         super().__init__(parent, fg_color = THEME_MAIN, corner_radius = 0, **kwargs)
         self.grid_columnconfigure(0, weight = 1)
         self.grid_rowconfigure(0, weight = 1)
-        self.raw_data = []
+        self.valuation = None # numeric rows in display order
+        self.cell_colours = {} # row -> highlight currently applied to the change column
+        self.rendered = np.zeros(0, dtype = bool) # rows whose price/total/change cells match the valuation
+        self.sheet_rows = np.zeros(0, dtype = int) # sheet row holding each valuation row, blank rows sit in between
+        self.last_yview = None
 
         # 0:Ticker, 1:Price, 2:Amount, 3:Total, 4:Change
         self.sheet = Sheet(
@@ -355,13 +468,17 @@ class MainFrame(ctk.CTkFrame):
         self.total_base = sum(self.base_widths)
         self.ModifyUsage()
 
-        self.bind("<Configure>", self.DynamicTableResize)
+        self.applied_layout = (None, None, None) # widths, row height, font last pushed to the sheet
+        self.layout = LayoutScheduler(self, self.DynamicTableResize)
+        self.bind("<Configure>", self.layout.Schedule)
+        self.after(VIEWPORT_POLL_MS, self.PollViewport)
 
     # Functionality
     def AddRow(self) -> None:
         '''Insert a new row with default values'''
         self.sheet.insert_row(["", "$0.00", "", "$0.00", "0.00%"])
-        self.DynamicTableResize()
+        self.cell_colours = {}
+        self.DynamicTableResize(force = True)
 
     def GetTableData(self) -> None:
         '''Returns all row data as a list of lists'''
@@ -373,9 +490,14 @@ class MainFrame(ctk.CTkFrame):
         if "total" in values_dict: self.sheet.set_cell_data(row_idx, 3, values_dict["total"])
         if "change" in values_dict: self.sheet.set_cell_data(row_idx,4, values_dict["change"])
     
+    def SetValuation(self, valuation: Valuation) -> None:
+        '''Replaces the displayed valuation and redraws the table'''
+        self.valuation = valuation
+        self.SyncSheet()
+
     def SortData(self, sort_metric: str) -> None:
-        '''Sorts the sheet based on the selected metric using raw_data keys'''
-        if not self.raw_data: return
+        '''Sorts the sheet based on the selected metric using the valuation columns'''
+        if self.valuation is None or not len(self.valuation): return
 
         # mapping
         metric_lookup = sort_metric.lower()
@@ -392,46 +514,103 @@ class MainFrame(ctk.CTkFrame):
             print(f"Sort Error: '{metric_lookup}' not found in mapping.")
             return
 
-        self.raw_data.sort(key = lambda x: x.get(key, 0), reverse = True)
-        self.SyncSheetWithRaw()
-    
-    def SyncSheetWithRaw(self) -> None:
-        '''Converts raw_data back into formatted strings for the sheet'''
-        formatted_table = []
-        for row in self.raw_data:
-            formatted_table.append([
-                row['ticker'],
-                row['price_str'],
-                row['quantity'],
-                row['total_str'],
-                row['change_str']
-            ])
-        
-        self.sheet.set_sheet_data(formatted_table)
-        
-        # Re-apply colors based on the raw pct
-        for idx, row in enumerate(self.raw_data):
-            colour = SOFT_GREEN if row['pct'] >= 0 else SOFT_RED
-            self.sheet.highlight_cells(row = idx, column = 4, bg = colour, fg = "white")
-        
-        self.DynamicTableResize(None)
+        # the valuation was made from these rows, so its order moves the sheet's own rows (blank rows kept at the end)
+        order = self.valuation.Order(key)
+        displayed = self.sheet.get_sheet_data()
+        filled = [row for row in displayed if row and str(row[0]).strip()]
+        if len(filled) != len(order): return
+
+        blank_rows = [["", "", "", "", ""] for _ in range(len(displayed) - len(filled))]
+        self.sheet.set_sheet_data([filled[idx] for idx in order] + blank_rows, redraw = False)
+        self.cell_colours = {}
+        if blank_rows:
+            self.sheet.dehighlight_cells(cells = [(row, 4) for row in range(len(filled), len(displayed))], redraw = False)
+
+        self.SetValuation(self.valuation.Take(order))
     
-    def DynamicTableResize(self, event = None) -> None:
+    def SyncSheet(self) -> None:
+        '''Maps valuation rows onto sheet rows, the formatted columns are written once a row scrolls into view'''
+        displayed = self.sheet.get_sheet_data()
+
+        # blank rows are not part of the valuation, e.g. one just added that has no ticker typed yet
+        filled = [idx for idx, row in enumerate(displayed) if row and str(row[0]).strip()]
+
+        # Ticker and Amount are the user's, rows the valuation no longer lines up with are skipped by RenderViewport
+        filled = filled[:len(self.valuation)]
+        self.sheet_rows = np.array(filled + [len(displayed)] * (len(self.valuation) - len(filled)), dtype = int)
+
+        self.rendered = np.zeros(len(self.valuation), dtype = bool)
+        self.RenderViewport()
+
+    def VisibleRows(self) -> tuple:
+        '''Sheet row range on screen plus overscan, rows share one height so the scroll fraction maps straight to a row'''
+        count = self.sheet.get_total_rows()
+        row_height = self.applied_layout[1] or 25
+        first = int(self.sheet.get_yview()[0] * count)
+
+        start = max(0, first - OVERSCAN_ROWS)
+        end = min(count, first + self.winfo_height() // row_height + 1 + OVERSCAN_ROWS)
+        return start, end
+
+    def RenderViewport(self) -> None:
+        '''Formats the rows in view that still hold placeholder or stale text'''
+        if self.valuation is None or not len(self.valuation): return
+
+        # valuation rows whose sheet row is in view
+        start, end = np.searchsorted(self.sheet_rows, self.VisibleRows())
+        pending = np.flatnonzero(~self.rendered[start:end]) + start
+        if not len(pending): return
+
+        # rows deleted or retyped since the valuation was made keep their text until the next refresh lands
+        total_rows = self.sheet.get_total_rows()
+        pending = [
+            idx for idx in pending.tolist()
+            if self.sheet_rows[idx] < total_rows and str(self.sheet.get_cell_data(self.sheet_rows[idx], 0)).strip().upper() == self.valuation.tickers[idx]
+        ]
+
+        changed_colours = {}
+        for idx in pending:
+            row, sheet_row = self.valuation.SheetRow(idx), int(self.sheet_rows[idx])
+            for column in (1, 3, 4):
+                if self.sheet.get_cell_data(sheet_row, column) != row[column]:
+                    self.sheet.set_cell_data(sheet_row, column, row[column], redraw = False)
+
+            # one highlight call per colour
+            pct = self.valuation.pct[idx]
+            colour = NO_PRICE if np.isnan(pct) else SOFT_GREEN if pct >= 0 else SOFT_RED
+            if self.cell_colours.get(sheet_row) != colour:
+                changed_colours.setdefault(colour, []).append((sheet_row, 4))
+                self.cell_colours[sheet_row] = colour
+
+        for colour, cells in changed_colours.items():
+            self.sheet.highlight_cells(cells = cells, bg = colour, fg = "white", redraw = False)
+
+        self.rendered[pending] = True
+        self.sheet.redraw()
+
+    def PollViewport(self) -> None:
+        '''The sheet has no scroll event, so the view position is checked on a short timer'''
+        yview = self.sheet.get_yview()
+        if yview != self.last_yview:
+            self.last_yview = yview
+            self.RenderViewport()
+
+        self.after(VIEWPORT_POLL_MS, self.PollViewport)
+
+    def DynamicTableResize(self, event = None, force: bool = False) -> None:
         '''Adjusts graph dimensions based on frame width while maintaining ratios'''
         current_width = (event.width if event else self.winfo_width()) - 60
         current_height = (event.height if event else self.winfo_height())
 
         # table
+        new_widths = None
         if current_width > 100:
             new_widths = []
             for w in self.base_widths:
                 calculated_width = int((w / self.total_base) * current_width)
                 new_widths.append(calculated_width)
-            
-            self.sheet.set_column_widths(new_widths)
         
         new_height = max(25, int(current_height / 12.5))
-        self.sheet.set_all_row_heights(new_height)
 
         # font 
         norm = min(1.0, current_height / 1000.0)
@@ -440,8 +619,23 @@ class MainFrame(ctk.CTkFrame):
         
         new_font_size = int(base_font + (growth_factor * (norm ** 2)))
         new_font = ("Helvetica", new_font_size, "normal")
-        self.sheet.font(new_font)
-        self.sheet.refresh()
+
+        # only push what changed since the last pass, new rows pick up the default height on their own
+        last_widths, last_height, last_font = self.applied_layout
+        if new_widths is not None and new_widths != last_widths:
+            self.sheet.set_column_widths(new_widths)
+        if new_height != last_height:
+            self.sheet.default_row_height(new_height)
+            self.sheet.set_all_row_heights(new_height)
+        if new_font != last_font:
+            self.sheet.font(new_font)
+
+        if force or (new_widths or last_widths, new_height, new_font) != self.applied_layout:
+            self.applied_layout = (new_widths or last_widths, new_height, new_font)
+            self.sheet.refresh()
+
+        # a taller table shows more rows
+        self.RenderViewport()
 
     # Aesthetics
     def ModifyUsage(self) -> None:
@@ -491,7 +685,7 @@ class MainFrame(ctk.CTkFrame):
         self.sheet.refresh()
 
 class ControlFrame(ctk.CTkFrame):
-    def __init__(self, parent, add_command: function, update_command: function, reset_command: function, toggle_command: function, sort_command: function, **kwargs):
+    def __init__(self, parent, add_command: Callable, update_command: Callable, reset_command: Callable, toggle_command: Callable, sort_command: Callable, **kwargs):
         super().__init__(parent, fg_color = THEME_TOP, corner_radius = 0, **kwargs)
 
         # Setup
@@ -528,16 +722,16 @@ class ControlFrame(ctk.CTkFrame):
         )
         self.menu_sort.place(relx = 0.41, rely = 0.2, relwidth = 0.18, relheight = 0.6)
 
-        self.switch_currency = ctk.CTkSwitch(
-            self, 
-            text = "USD/NZD",
-            variable = self.currency_var, 
+        self.menu_currency = ctk.CTkOptionMenu(
+            self,
+            values = DISPLAY_CURRENCIES,
+            variable = self.currency_var,
             command = toggle_command,
-            progress_color = BTN_REG, 
-            onvalue = "NZD", offvalue = "USD",
-            text_color = "white"
+            fg_color = BTN_REG,
+            button_color = BTN_REG,
+            button_hover_color = BTN_HOVER
         )
-        self.switch_currency.place(relx = 0.61, rely = 0.2, relwidth = 0.18, relheight = 0.6)
+        self.menu_currency.place(relx = 0.61, rely = 0.2, relwidth = 0.18, relheight = 0.6)
 
         self.button_reset = ctk.CTkButton(
             self, text = "Reset", fg_color = BTN_RESET, hover_color = BTN_RESET_HOVER, width = 80,
@@ -548,18 +742,53 @@ class ControlFrame(ctk.CTkFrame):
         # to make the drop down menu more uniform
         self.menu_sort.bind("<Enter>", lambda e: self.menu_sort.configure(fg_color = BTN_HOVER, button_color = BTN_HOVER))
         self.menu_sort.bind("<Leave>", lambda e: self.menu_sort.configure(fg_color = BTN_REG, button_color = BTN_REG))
+        self.menu_currency.bind("<Enter>", lambda e: self.menu_currency.configure(fg_color = BTN_HOVER, button_color = BTN_HOVER))
+        self.menu_currency.bind("<Leave>", lambda e: self.menu_currency.configure(fg_color = BTN_REG, button_color = BTN_REG))
 
 class GraphFrame(ctk.CTkFrame):
-    def __init__(self, parent, **kwargs):
+    def __init__(self, parent, range_command: Callable, **kwargs):
         super().__init__(parent, fg_color = THEME_MAIN, corner_radius = 0, **kwargs)
-        
-        self.fig, self.ax = plt.subplots(figsize = (5, 4), dpi = 100)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
-        self.canvas.get_tk_widget().pack(fill = "both", expand = True, padx = 5, pady = 5)
+
+        # range selector
+        self.range_var = ctk.StringVar(value = "1Y")
+        self.chart_range = None # range of the data currently plotted, None until the first draw
+        self.button_range = ctk.CTkSegmentedButton(
+            self,
+            values = list(CHART_RANGES),
+            variable = self.range_var,
+            command = range_command,
+            fg_color = THEME_TOP,
+            selected_color = BTN_REG,
+            selected_hover_color = BTN_HOVER,
+            unselected_color = THEME_TOP,
+            unselected_hover_color = BTN_RESET_HOVER,
+            text_color = "white"
+        )
+        self.button_range.pack(fill = "x", padx = 5, pady = (5, 0))
+
+        # matplotlib is only loaded once there is a series to draw
+        self.fig = self.ax = self.canvas = None
 
         # Store data references for the hover logic
         self.line_data_x = []
         self.line_data_y = []
+        self.line_data_nums = np.empty(0) # x positions as matplotlib date numbers
+        self.hover_index = None
+        self.background = None            # figure pixels without the tooltip, used for blitting
+        self.point_budget = None          # points plotted per line, one per pixel column
+
+        self.layout = LayoutScheduler(self, self.OnResize)
+        self.bind("<Configure>", self.layout.Schedule)
+
+    def CreateFigure(self) -> None:
+        '''Builds the canvas on first use, importing matplotlib here keeps it off the startup path'''
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize = (5, 4), dpi = 100)
+        self.ax = self.fig.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.fig, master = self)
+        self.canvas.get_tk_widget().pack(fill = "both", expand = True, padx = 5, pady = 5)
 
         self.SetStyle()
         
@@ -568,20 +797,35 @@ class GraphFrame(ctk.CTkFrame):
             "", xy = (0,0), xytext = (10, 10),
             textcoords = "offset points",
             bbox = dict(boxstyle = "round", fc = "white", alpha = 0.8),
-            arrowprops = dict(arrowstyle = "->", color = 'white')
+            arrowprops = dict(arrowstyle = "->", color = 'white'),
+            animated = True
         )
         self.annotation_box.set_visible(False)
         
         # 2. Bind the motion event
         self.canvas.mpl_connect("motion_notify_event", self.OnHover)
-        self.bind("<Configure>", self.OnResize)
+        self.canvas.mpl_connect("draw_event", self.OnDraw)
 
-    def UpdateChart(self, dates: list, values: list) -> None:
-        '''Clears existing plot and draws new data.'''
+    def UpdateChart(self, dates: list, values: list, chart_range: str = "1Y") -> None:
+        '''Stores the full series and draws it.'''
         if dates is None or values is None or len(dates) == 0: return
+        self.chart_range = chart_range
+        if self.canvas is None: self.CreateFigure()
+        from matplotlib.dates import date2num
 
+        # hover always resolves against the full resolution data
         self.line_data_x = dates
-        self.line_data_y = values
+        self.line_data_y = np.asarray(values, dtype = float)
+        self.line_data_nums = date2num(dates)
+        self.DrawSeries()
+
+    def DrawSeries(self) -> None:
+        '''Clears existing plot and draws the series downsampled to the canvas width.'''
+        self.hover_index = None
+        self.point_budget = max(3, self.canvas.get_width_height()[0])
+        shown = Downsample(self.line_data_nums, self.line_data_y, self.point_budget)
+        dates = self.line_data_nums[shown]
+        values = self.line_data_y[shown]
 
         self.ax.clear()
         self.SetStyle()
@@ -592,14 +836,16 @@ class GraphFrame(ctk.CTkFrame):
             textcoords = "offset points",
             bbox = dict(boxstyle = "round", fc = ANNOT_BG, ec = "white"),
             color = "white", fontsize = 8,
-            arrowprops = dict(arrowstyle = "->", color = "white")
+            arrowprops = dict(arrowstyle = "->", color = "white"),
+            animated = True
         )
         self.annotation_box.set_visible(False)
                
         # Personalised style for data
         self.ax.plot(dates, values, color = LINE_PLOT, linewidth = 2, zorder = 2)
+        self.ax.xaxis_date()
 
-        minimum_value = min(values) 
+        minimum_value = values.min() 
         self.ax.set_ylim(bottom = minimum_value * 0.99) # Add 1% breathing room  
         y_min = self.ax.get_ylim()[0]
         self.ax.fill_between(
@@ -616,38 +862,58 @@ class GraphFrame(ctk.CTkFrame):
         self.fig.tight_layout()
         self.canvas.draw() 
 
+    def OnDraw(self, event = None) -> None:
+        '''Caches the freshly drawn figure so the tooltip can be blitted over it'''
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        if self.annotation_box.get_visible():
+            self.ax.draw_artist(self.annotation_box)
+
+    def BlitAnnotation(self) -> None:
+        '''Repaints only the tooltip over the cached background'''
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        if self.annotation_box.get_visible():
+            self.ax.draw_artist(self.annotation_box)
+        self.canvas.blit(self.fig.bbox)
+
     def OnHover(self, event) -> None:
         '''Calculates nearest point and toggles visibility of the tooltip.'''
         is_visible = self.annotation_box.get_visible()
         
-        if event.inaxes == self.ax and event.xdata is not None:
+        if event.inaxes == self.ax and event.xdata is not None and len(self.line_data_nums):
             try:
                 # find point
-                x_data_nums = mdates.date2num(self.line_data_x)
-                index = np.argmin(np.abs(x_data_nums - event.xdata))
-                self.annotation_box.xy = (self.line_data_x[index], self.line_data_y[index])
-
+                index = NearestIndex(self.line_data_nums, event.xdata)
                 canvas_width = self.canvas.get_width_height()[0]
-                
+                offset = (-100, 10) if event.x > (canvas_width * 0.6) else (10, 10)
+
+                # nothing moved, skip the repaint
+                if is_visible and index == self.hover_index and offset == self.annotation_box.get_position(): return
+                self.hover_index = index
+
+                self.annotation_box.xy = (self.line_data_nums[index], self.line_data_y[index])
+
                 # determines which side the annotation box appears
-                if event.x > (canvas_width * 0.6):
-                    self.annotation_box.set_position((-100, 10)) 
-                else:
-                    self.annotation_box.set_position((10, 10))
+                self.annotation_box.set_position(offset)
                 
                 # format
-                date_string = self.line_data_x[index].strftime("%b %d, %Y")
+                date_format = "%b %d, %H:%M" if CHART_RANGES[self.chart_range][0] == "intraday" else "%b %d, %Y"
+                date_string = self.line_data_x[index].strftime(date_format)
                 text = f"{date_string}\nUS${self.line_data_y[index]:,.2f}"
                 
                 self.annotation_box.set_text(text)
                 self.annotation_box.set_visible(True)
-                self.canvas.draw_idle()
+                self.BlitAnnotation()
             except (ValueError, TypeError) as e:
                 print(f"Error on hover: {e}")
         else:
             if is_visible:
                 self.annotation_box.set_visible(False)
-                self.canvas.draw_idle()
+                self.hover_index = None
+                self.BlitAnnotation()
 
     # Aesthetics and design
     def SetStyle(self) -> None:
@@ -666,12 +932,22 @@ class GraphFrame(ctk.CTkFrame):
         
         # Grid Configuration
         self.ax.yaxis.grid(True, linestyle = "--", alpha = 0.3, color = "gray", zorder = 1)
-        self.ax.set_title("Portfolio Performance (1Y)", color = "white", fontsize = 10, pad = 10)
+        self.ax.set_title(f"Portfolio Performance ({self.chart_range})", color = "white", fontsize = 10, pad = 10)
         self.OnResize()
 
     def OnResize(self, event = None):
         '''Adjusts tick density and font size based on current width.'''
+        if self.canvas is None: return
+        from matplotlib.dates import DateFormatter
+        from matplotlib.ticker import MaxNLocator
+
         current_width = (event.width if event else self.winfo_width())
+
+        # a long series needs a new point budget once the canvas width changes
+        canvas_width = self.canvas.get_width_height()[0]
+        if event is not None and self.point_budget not in (None, canvas_width) and len(self.line_data_nums) > min(self.point_budget, canvas_width):
+            self.DrawSeries()
+            return
         
         # Find the first threshold that fits
         thresholds = [
@@ -685,9 +961,15 @@ class GraphFrame(ctk.CTkFrame):
                 nbins, font_size, date_format = bins, size, fmt
                 break
 
+        # intraday ranges label times rather than dates
+        if self.chart_range == "1D":
+            date_format = "%H:%M"
+        elif self.chart_range == "1W":
+            date_format = "%a %H:%M"
+
         #nApply to axis without clearing the whole plot
         self.ax.xaxis.set_major_locator(MaxNLocator(nbins = nbins))
-        self.ax.xaxis.set_major_formatter(mdates.DateFormatter(date_format))
+        self.ax.xaxis.set_major_formatter(DateFormatter(date_format))
         self.ax.tick_params(axis = "x", labelsize = font_size)
         
         # 3. Refresh canvas
@@ -0,0 +1,280 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import random
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+# Lookback lengths understood by every provider (yfinance style period strings)
+PERIODS = {
+    "d": lambda n: pd.DateOffset(days = n),
+    "wk": lambda n: pd.DateOffset(weeks = n),
+    "mo": lambda n: pd.DateOffset(months = n),
+    "y": lambda n: pd.DateOffset(years = n),
+}
+
+# Regular session of the US exchanges the portfolio trades on
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+try:
+    MARKET_TZ = ZoneInfo("America/New_York")
+except ZoneInfoNotFoundError:
+    # Windows without the tzdata package, fall back to standard time
+    MARKET_TZ = timezone(timedelta(hours = -5))
+
+# Minimum gap between requests to Yahoo (seconds)
+MIN_REQUEST_GAP = 2.0
+
+# Seconds before a single request (or chunk) is given up on
+REQUEST_TIMEOUT = 20.0
+
+# Large ticker lists are split into chunks fetched by a small pool
+CHUNK_SIZE = 50
+CHUNK_WORKERS = 4
+CHUNK_RETRIES = 3
+CHUNK_BACKOFF = 1.0 # seconds, doubled after every failed attempt
+
+# Rough starting levels so generated FX pairs look like real quotes
+FAKE_FX_LEVELS = {"NZD": 1.7, "AUD": 1.5, "CAD": 1.37, "EUR": 0.92, "GBP": 0.78, "JPY": 150.0, "CHF": 0.88, "HKD": 7.8, "SGD": 1.34}
+#endregion
+
+def MarketOpen(now: datetime | None = None) -> bool:
+    '''True during the regular weekday session in New York'''
+    now = (now or datetime.now(timezone.utc)).astimezone(MARKET_TZ)
+    if now.weekday() >= 5: return False
+    return MARKET_OPEN <= (now.hour, now.minute) < MARKET_CLOSE
+
+def PeriodStart(period: str, end: pd.Timestamp) -> pd.Timestamp | None:
+    '''Converts a period string such as "7d" or "1y" into a start date, None for "max"'''
+    if period == "max": return None
+
+    for suffix, offset in PERIODS.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return end - offset(int(period[:-len(suffix)]))
+
+    raise ValueError(f"Unknown period '{period}'")
+
+def ResampleWeekly(daily: pd.DataFrame) -> pd.DataFrame:
+    '''Reduces daily closes to weekly bars labelled by the Monday that opens the week, like yfinance'''
+    return daily.resample("W-MON", label = "left", closed = "left").last()
+
+def MissingTickers(closes: pd.DataFrame, tickers: list) -> list:
+    '''Tickers the frame has no close for, e.g. the ones a download could not resolve'''
+    return [ticker for ticker in tickers if ticker not in closes.columns or closes[ticker].isna().all()]
+
+def FxTicker(currency: str) -> str:
+    '''Yahoo symbol quoting how many units of currency one USD buys'''
+    return f"{currency}=X"
+
+class MarketDataProvider(ABC):
+    '''Source of closing prices; every method returns frames indexed by date with one column per ticker'''
+    concurrent = True # False when calls cannot overlap, ChunkedProvider then sends one batch
+    @abstractmethod
+    def DailyBars(self, tickers: list, period: str = "7d", prepost: bool = False, start: pd.Timestamp | None = None) -> pd.DataFrame:
+        '''Daily closes over the period, or from start onwards when it is given'''
+
+    def WeeklyHistory(self, tickers: list, period: str = "1y") -> pd.DataFrame:
+        '''Weekly closes over the period, resampled from the daily bars unless the source has its own'''
+        return ResampleWeekly(self.DailyBars(tickers, period))
+
+    @abstractmethod
+    def IntradayBars(self, tickers: list, period: str = "5d", interval: str = "5m") -> pd.DataFrame:
+        '''Intraday closes over the last few sessions'''
+
+    # Convenience for scripts, the engine builds quotes and rates from DailyBars itself
+    def Quotes(self, tickers: list) -> pd.Series:
+        '''Latest close per ticker'''
+        return self.DailyBars(tickers, period = "7d", prepost = True).ffill().iloc[-1]
+
+    def FxRates(self, currencies: list) -> pd.Series:
+        '''Units of each currency per USD, indexed by currency code'''
+        rates = self.Quotes([FxTicker(currency) for currency in currencies])
+        return pd.Series({currency: float(rates[FxTicker(currency)]) for currency in currencies})
+
+class RateLimiter:
+    '''Spaces calls at least min_interval seconds apart across every thread'''
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.last_call = float("-inf")
+        self.lock = threading.Lock()
+
+    def Wait(self) -> None:
+        '''Blocks until the next call is allowed'''
+        with self.lock:
+            wait = self.min_interval - (time.monotonic() - self.last_call)
+            if wait > 0: time.sleep(wait)
+            self.last_call = time.monotonic()
+
+class YFinanceProvider(MarketDataProvider):
+    '''Live data from Yahoo Finance, yfinance is only imported on first use'''
+    concurrent = False # downloads are serialized and rate limited, yfinance threads across tickers itself
+
+    def __init__(self, min_interval: float = MIN_REQUEST_GAP, timeout: float = REQUEST_TIMEOUT):
+        self.limiter = RateLimiter(min_interval)
+        self.timeout = timeout # per HTTP request, so a stalled download fails instead of hanging the job
+
+        # yf.download collects results in module globals, so overlapping calls would mix their frames
+        self.download_lock = threading.Lock()
+
+    def Download(self, tickers: list, **kwargs) -> pd.DataFrame:
+        '''Runs yf.download and reduces the result to a close-only frame'''
+        import yfinance as yf
+
+        with self.download_lock:
+            self.limiter.Wait()
+            data = yf.download(tickers, progress = False, timeout = self.timeout, **kwargs)
+        close_data = data['Close'] if 'Close' in data else data
+
+        # single ticker downloads can come back as a Series
+        if isinstance(close_data, pd.Series):
+            close_data = close_data.to_frame(tickers[0])
+        return close_data
+
+    def DailyBars(self, tickers: list, period: str = "7d", prepost: bool = False, start: pd.Timestamp | None = None) -> pd.DataFrame:
+        if start is not None:
+            return self.Download(tickers, start = start.strftime("%Y-%m-%d"), interval = "1d", prepost = prepost)
+        return self.Download(tickers, period = period, interval = "1d", prepost = prepost)
+
+    def WeeklyHistory(self, tickers: list, period: str = "1y") -> pd.DataFrame:
+        return self.Download(tickers, period = period, interval = "1wk")
+
+    def IntradayBars(self, tickers: list, period: str = "5d", interval: str = "5m") -> pd.DataFrame:
+        return self.Download(tickers, period = period, interval = interval)
+
+class ChunkedProvider(MarketDataProvider):
+    '''Wraps another provider, fetching big ticker lists in parallel chunks so one bad chunk cannot blank the rest'''
+    def __init__(self, provider: MarketDataProvider, chunk_size: int = CHUNK_SIZE, workers: int = CHUNK_WORKERS, retries: int = CHUNK_RETRIES, backoff: float = CHUNK_BACKOFF, timeout: float = REQUEST_TIMEOUT * (CHUNK_RETRIES + 1)):
+        self.provider = provider
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout # seconds a chunk, retries included, may take before it counts as failed
+        self.pool = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "chunk")
+
+    def FetchChunk(self, method: str, chunk: list, kwargs: dict) -> pd.DataFrame:
+        '''One chunk with exponential backoff (plus jitter) between attempts'''
+        for attempt in range(self.retries + 1):
+            try:
+                closes = getattr(self.provider, method)(chunk, **kwargs)
+                if closes.empty: raise ValueError(f"no data for {chunk[0]}..{chunk[-1]}")
+                return closes
+            except Exception as e:
+                if attempt == self.retries: raise
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+                print(f"Chunk retry {attempt + 1} in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def Fetch(self, method: str, tickers: list, **kwargs) -> pd.DataFrame:
+        '''Runs method over every chunk and merges whatever succeeded, tickers of a failed chunk are left out of the frame'''
+        # chunks of a serial provider would only queue behind each other, one rate limited batch is faster
+        if len(tickers) <= self.chunk_size or not self.provider.concurrent:
+            return self.FetchChunk(method, tickers, kwargs)
+
+        chunks = [tickers[index:index + self.chunk_size] for index in range(0, len(tickers), self.chunk_size)]
+        futures = [self.pool.submit(self.FetchChunk, method, chunk, kwargs) for chunk in chunks]
+
+        frames = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                frames.append(future.result(timeout = self.timeout))
+            except Exception as e:
+                print(f"Chunk failed ({len(chunk)} tickers): {e}")
+
+        if not frames: raise RuntimeError("every chunk failed")
+        return pd.concat(frames, axis = 1).sort_index()
+
+    def DailyBars(self, tickers: list, period: str = "7d", prepost: bool = False, start: pd.Timestamp | None = None) -> pd.DataFrame:
+        return self.Fetch("DailyBars", tickers, period = period, prepost = prepost, start = start)
+
+    def WeeklyHistory(self, tickers: list, period: str = "1y") -> pd.DataFrame:
+        return self.Fetch("WeeklyHistory", tickers, period = period)
+
+    def IntradayBars(self, tickers: list, period: str = "5d", interval: str = "5m") -> pd.DataFrame:
+        return self.Fetch("IntradayBars", tickers, period = period, interval = interval)
+
+class FakeProvider(MarketDataProvider):
+    '''Deterministic offline provider serving recorded or generated daily closes'''
+    def __init__(self, daily: pd.DataFrame | None = None, end: str | None = None, delay: float = 0.0, seed: int = 0):
+        self.end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+        self.daily = daily if daily is not None else pd.DataFrame(index = pd.DatetimeIndex([], name = "Date"))
+        self.delay = delay # seconds slept per call to mimic network latency
+        self.seed = seed
+        self.calls = 0
+        self.lock = threading.Lock() # ChunkedProvider calls in from several threads at once
+
+    # Persistence
+    @classmethod
+    def Load(cls, path: str, **kwargs) -> "FakeProvider":
+        '''Replays closes previously written with Save or Record'''
+        daily = pd.read_csv(path, index_col = 0, parse_dates = True)
+        return cls(daily, end = kwargs.pop("end", daily.index.max()), **kwargs)
+
+    def Save(self, path: str) -> None:
+        '''Writes every close served so far to a CSV file'''
+        self.daily.to_csv(path)
+
+    @classmethod
+    def Record(cls, provider: MarketDataProvider, tickers: list, path: str, period: str = "1y") -> "FakeProvider":
+        '''Captures a live session from another provider so it can be replayed offline'''
+        fake = cls(provider.DailyBars(tickers, period = period))
+        fake.Save(path)
+        return fake
+
+    # Data generation
+    def Generate(self, ticker: str) -> pd.Series:
+        '''Random walk that is identical for the same ticker and seed on every run'''
+        dates = pd.bdate_range(end = self.end, periods = 5 * 261, name = "Date")
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()) + self.seed)
+
+        is_fx = ticker.endswith("=X")
+        start = FAKE_FX_LEVELS.get(ticker[:-2], 1.0) if is_fx else rng.uniform(10, 500)
+        returns = rng.normal(0.0 if is_fx else 0.0003, 0.004 if is_fx else 0.02, len(dates))
+        return pd.Series(start * np.exp(np.cumsum(returns)), index = dates, name = ticker)
+
+    def Closes(self, tickers: list) -> pd.DataFrame:
+        '''Daily closes for the tickers, generating any that were never recorded'''
+        with self.lock:
+            missing = [ticker for ticker in tickers if ticker not in self.daily.columns]
+            if missing:
+                generated = pd.concat([self.Generate(ticker) for ticker in missing], axis = 1)
+                self.daily = generated if self.daily.empty else self.daily.join(generated, how = "outer")
+
+            self.calls += 1
+            closes = self.daily[tickers]
+
+        if self.delay: time.sleep(self.delay)
+        return closes
+
+    def DailyBars(self, tickers: list, period: str = "7d", prepost: bool = False, start: pd.Timestamp | None = None) -> pd.DataFrame:
+        closes = self.Closes(tickers)
+        if start is not None:
+            return closes[closes.index >= start]
+
+        start = PeriodStart(period, self.end)
+        return closes[closes.index > start] if start is not None else closes
+
+    def IntradayBars(self, tickers: list, period: str = "5d", interval: str = "5m") -> pd.DataFrame:
+        # walk from each previous close to the session close in regular session steps
+        daily = self.DailyBars(tickers, period = "1mo")
+        sessions = daily.index[-int(period[:-1]) - 1:]
+        step = pd.Timedelta(interval.replace("m", "min"))
+        frames = []
+
+        for previous, session in zip(sessions[:-1], sessions[1:]):
+            times = pd.date_range(session + pd.Timedelta(hours = 9, minutes = 30), session + pd.Timedelta(hours = 16), freq = step, inclusive = "left")
+            weights = np.linspace(0, 1, len(times) + 1)[1:, None]
+            rng = np.random.default_rng(int(session.timestamp()) + self.seed)
+            noise = rng.normal(0, 0.002, (len(times), len(tickers))) * np.sin(np.pi * weights)
+            path = daily.loc[previous].to_numpy() + (daily.loc[session].to_numpy() - daily.loc[previous].to_numpy()) * weights
+            frames.append(pd.DataFrame(path * (1 + noise), index = times, columns = tickers))
+
+        return pd.concat(frames).rename_axis("Datetime")
@@ -0,0 +1,443 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+# Local modules
+from StockProviders import MarketOpen
+
+HISTORY_FILE = "price_cache.db"
+PORTFOLIO_FILE = "portfolio.json"
+DATABASE_FILE = "portfolio.db"
+SNAPSHOT_FILE = "last_prices.npz"
+#endregion
+
+class HistoryCache:
+    '''On-disk store of daily closes so refreshes only download bars newer than the cache'''
+    def __init__(self, path: str = HISTORY_FILE, evict_after_days: int = 30):
+        self.path = path
+        self.evict_after_days = evict_after_days # unused tickers are dropped after this long
+        self.lock = threading.Lock()
+
+        with self.Connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS bars (ticker TEXT, date TEXT, close REAL, PRIMARY KEY (ticker, date))")
+            conn.execute("CREATE TABLE IF NOT EXISTS tickers (ticker TEXT PRIMARY KEY, last_used TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS coverage (ticker TEXT PRIMARY KEY, start TEXT)")
+
+    @contextmanager
+    def Connect(self):
+        '''Short lived connection so the cache can be used from any thread'''
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Reading
+    def LastDates(self, tickers: list) -> dict:
+        '''Most recent cached bar per ticker, tickers without bars are left out'''
+        with self.lock, self.Connect() as conn:
+            rows = conn.execute(
+                f"SELECT ticker, MAX(date) FROM bars WHERE ticker IN ({','.join('?' * len(tickers))}) GROUP BY ticker",
+                tickers
+            ).fetchall()
+        return {ticker: pd.Timestamp(date) for ticker, date in rows}
+
+    def TopUpStarts(self, tickers: list) -> dict:
+        '''Download start -> tickers starting there, None grouping the tickers with no history yet'''
+        last_dates = self.LastDates(tickers)
+
+        # each ticker resumes from its own newest bar, re-fetched as it may have been an unfinished session
+        starts = {}
+        for ticker in dict.fromkeys(tickers):
+            starts.setdefault(last_dates.get(ticker), []).append(ticker)
+        return starts
+
+    def Covers(self, tickers: list, start: pd.Timestamp | None) -> bool:
+        '''True when every ticker has been downloaded back to start, None meaning full history'''
+        start_text = start.strftime("%Y-%m-%d") if start is not None else ""
+        with self.lock, self.Connect() as conn:
+            covered = conn.execute(
+                f"SELECT COUNT(*) FROM coverage WHERE ticker IN ({','.join('?' * len(tickers))}) AND start <= ?",
+                tickers + [start_text]
+            ).fetchone()[0]
+        return covered == len(set(tickers))
+
+    def Read(self, tickers: list, start: pd.Timestamp | None = None) -> pd.DataFrame:
+        '''Cached closes as a date x ticker frame'''
+        start_text = start.strftime("%Y-%m-%d") if start is not None else ""
+        with self.lock, self.Connect() as conn:
+            rows = conn.execute(
+                f"SELECT date, ticker, close FROM bars WHERE ticker IN ({','.join('?' * len(tickers))}) AND date >= ?",
+                tickers + [start_text]
+            ).fetchall()
+
+        frame = pd.DataFrame(rows, columns = ["Date", "Ticker", "Close"])
+        frame["Date"] = pd.to_datetime(frame["Date"])
+        closes = frame.pivot(index = "Date", columns = "Ticker", values = "Close")
+        return closes.reindex(columns = [ticker for ticker in tickers if ticker in closes.columns])
+
+    # Writing
+    def Write(self, closes: pd.DataFrame) -> None:
+        '''Upserts every non-empty close in the frame'''
+        stacked = closes.stack().dropna()
+        rows = [(ticker, date.strftime("%Y-%m-%d"), float(close)) for (date, ticker), close in stacked.items()]
+
+        with self.lock, self.Connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?)", rows)
+
+    def SetCoverage(self, tickers: list, start: pd.Timestamp | None) -> None:
+        '''Records how far back a full download reached, never narrowing an earlier one'''
+        start_text = start.strftime("%Y-%m-%d") if start is not None else ""
+        with self.lock, self.Connect() as conn:
+            conn.executemany(
+                "INSERT INTO coverage VALUES (?, ?) ON CONFLICT (ticker) DO UPDATE SET start = MIN(start, excluded.start)",
+                [(ticker, start_text) for ticker in tickers]
+            )
+
+    def Touch(self, tickers: list) -> None:
+        '''Marks tickers as held and evicts the ones that left the portfolio long enough ago'''
+        now = datetime.now()
+        evict_before = (now - timedelta(days = self.evict_after_days)).isoformat()
+
+        with self.lock, self.Connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO tickers VALUES (?, ?)", [(ticker, now.isoformat()) for ticker in tickers])
+            for table in ("bars", "coverage"):
+                conn.execute(f"DELETE FROM {table} WHERE ticker IN (SELECT ticker FROM tickers WHERE last_used < ?)", (evict_before,))
+            conn.execute("DELETE FROM tickers WHERE last_used < ?", (evict_before,))
+
+class QuoteCache:
+    '''In-memory TTL cache that also shares a single in-flight fetch between concurrent callers'''
+    def __init__(self, open_ttl: float = 60.0, closed_ttl: float = 1800.0, max_entries: int = 8):
+        self.open_ttl = open_ttl     # seconds while the market is trading
+        self.closed_ttl = closed_ttl # seconds while prices cannot move
+        self.max_entries = max_entries # every ticker edit makes a new key, so old frames must not pile up
+        self.entries = {}            # key -> (expiry, value)
+        self.in_flight = {}          # key -> Future of the running fetch
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def TTL(self) -> float:
+        '''Lifetime of a new entry based on the current market state'''
+        return self.open_ttl if MarketOpen() else self.closed_ttl
+
+    def Get(self, key, loader):
+        '''Returns the cached value for key, calling loader at most once per expiry'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+            pending = self.in_flight.get(key)
+            is_owner = pending is None
+            if is_owner:
+                self.misses += 1
+                pending = self.in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        # someone else is already fetching, wait for their result
+        if not is_owner: return pending.result()
+
+        try:
+            value = loader()
+            with self.lock:
+                self.entries[key] = (time.monotonic() + self.TTL(), value)
+                self.Prune()
+            pending.set_result(value)
+            return value
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def Prune(self) -> None:
+        '''Drops expired entries, then the soonest to expire beyond max_entries (call with the lock held)'''
+        now = time.monotonic()
+        for key in [key for key, (expiry, _) in self.entries.items() if expiry <= now]:
+            del self.entries[key]
+
+        for key in sorted(self.entries, key = lambda key: self.entries[key][0])[:max(0, len(self.entries) - self.max_entries)]:
+            del self.entries[key]
+
+    def Invalidate(self) -> None:
+        '''Drops every cached entry so the next Get fetches again'''
+        with self.lock:
+            self.entries.clear()
+
+    def Stats(self) -> dict:
+        '''Hit/miss counters, coalesced calls waited on a fetch already in flight'''
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+class PortfolioStore:
+    '''portfolio.json snapshot plus an append-only journal of row edits, folded back in atomically'''
+    def __init__(self, path: str = PORTFOLIO_FILE, compact_after: int = 200):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.compact_after = compact_after # journal lines before the snapshot is rewritten
+        self.lock = threading.Lock()
+
+        self.rows = []         # [ticker, amount] as last persisted
+        self.base = 0          # crc of the snapshot the journal applies to
+        self.journal_lines = 0
+
+    # Reading
+    def Load(self) -> list:
+        '''Snapshot with the journal replayed, a corrupt snapshot is moved aside rather than dropped'''
+        with self.lock:
+            try:
+                with open(self.path, "rb") as file:
+                    content = file.read()
+                self.rows = [[str(item["ticker"]), str(item["amount"])] for item in json.loads(content)]
+                self.base = zlib.crc32(content)
+            except FileNotFoundError:
+                self.rows, self.base = [], 0
+            except (ValueError, TypeError, KeyError) as e:
+                backup = f"{self.path}.corrupt-{datetime.now():%Y%m%d%H%M%S}"
+                os.replace(self.path, backup)
+                print(f"Portfolio file unreadable ({e!r}), kept as {backup}")
+                self.rows, self.base = [], 0
+
+            self.journal_lines = 0
+            for entry in self.ReadJournal():
+                # entries written against an older snapshot were already folded into this one
+                if entry.get("base") != self.base: continue
+                if "rows" in entry:
+                    self.Resize(entry["rows"])
+                else:
+                    self.Resize(max(len(self.rows), entry["row"] + 1))
+                    self.rows[entry["row"]] = [entry["ticker"], entry["amount"]]
+                self.journal_lines += 1
+
+            return [row[:] for row in self.rows]
+
+    def ReadJournal(self) -> list:
+        '''Journal entries in order, a torn final line from a crash mid-append is ignored'''
+        entries = []
+        try:
+            with open(self.journal_path, "r") as file:
+                for line in file:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def Resize(self, count: int) -> None:
+        '''Truncates or pads the row list to count rows'''
+        del self.rows[count:]
+        self.rows.extend([["", ""] for _ in range(count - len(self.rows))])
+
+    # Writing
+    def Save(self, rows: list, compact: bool = False) -> None:
+        '''Journals only the rows that differ from what was last persisted, compact folds the journal in now'''
+        rows = [[str(ticker), str(amount)] for ticker, amount in rows]
+        with self.lock:
+            entries = [
+                {"base": self.base, "row": idx, "ticker": ticker, "amount": amount}
+                for idx, (ticker, amount) in enumerate(rows)
+                if idx >= len(self.rows) or self.rows[idx] != [ticker, amount]
+            ]
+            if len(rows) != len(self.rows):
+                entries.append({"base": self.base, "rows": len(rows)})
+
+            if not entries and not (compact and self.journal_lines): return
+
+            self.rows = rows
+            if compact or self.journal_lines + len(entries) >= self.compact_after:
+                self.Compact()
+                return
+
+            with open(self.journal_path, "a") as file:
+                file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+                file.flush()
+                os.fsync(file.fileno())
+            self.journal_lines += len(entries)
+
+    def Compact(self) -> None:
+        '''Writes the full snapshot through a temp file and rename, then starts an empty journal'''
+        content = json.dumps([{"ticker": ticker, "amount": amount} for ticker, amount in self.rows], indent = 4).encode()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+        # a crash before the truncate is harmless, old entries no longer match the new snapshot's crc
+        self.base = zlib.crc32(content)
+        open(self.journal_path, "w").close()
+        self.journal_lines = 0
+
+class PortfolioDatabase:
+    '''SQLite store of sheet positions, the transactions that changed them and the FIFO lots they left open'''
+    def __init__(self, path: str = DATABASE_FILE, prices_path: str = HISTORY_FILE, legacy_path: str = PORTFOLIO_FILE):
+        self.path = path
+        self.prices_path = prices_path # HistoryCache file holding the cached closes
+        self.lock = threading.Lock()
+        self.rows = [] # (ticker, quantity) as last persisted
+
+        with self.Connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, ticker TEXT NOT NULL, quantity REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY, date TEXT NOT NULL, ticker TEXT NOT NULL, quantity REAL NOT NULL, price REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS lots (id INTEGER PRIMARY KEY, ticker TEXT NOT NULL, opened TEXT NOT NULL, quantity REAL NOT NULL, cost REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS positions_ticker ON positions (ticker)")
+            conn.execute("CREATE INDEX IF NOT EXISTS transactions_ticker_date ON transactions (ticker, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS lots_ticker_opened ON lots (ticker, opened)")
+            empty = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM positions) AND NOT EXISTS (SELECT 1 FROM transactions)").fetchone()[0]
+
+        # first run after the JSON file, its rows become the opening transactions
+        if empty and os.path.exists(legacy_path):
+            self.Save(QuantityRows(PortfolioStore(legacy_path).Load()))
+        self.Load()
+
+    @contextmanager
+    def Connect(self):
+        '''Short lived connection, each with block commits as one transaction'''
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Reading
+    def Load(self) -> list:
+        '''Positions in sheet order as (ticker, quantity)'''
+        with self.lock, self.Connect() as conn:
+            self.rows = conn.execute("SELECT ticker, quantity FROM positions ORDER BY position").fetchall()
+        return list(self.rows)
+
+    def Lots(self, ticker: str) -> list:
+        '''Open lots for a ticker, oldest first, as (opened, quantity, cost)'''
+        with self.lock, self.Connect() as conn:
+            return conn.execute("SELECT opened, quantity, cost FROM lots WHERE ticker = ? ORDER BY opened, id", (ticker,)).fetchall()
+
+    def ValueOn(self, date: pd.Timestamp) -> pd.DataFrame:
+        '''Holdings on a date from the transaction history, valued at the last cached close on or before it (native currency)'''
+        date_text = pd.Timestamp(date).strftime("%Y-%m-%d")
+        with self.lock, self.Connect() as conn:
+            # attaching a missing file would create it, so only look for bars in a cache that exists
+            has_bars = os.path.exists(self.prices_path)
+            if has_bars:
+                conn.execute("ATTACH DATABASE ? AS prices", (self.prices_path,))
+                has_bars = conn.execute("SELECT COUNT(*) FROM prices.sqlite_master WHERE name = 'bars'").fetchone()[0] > 0
+            close_query = "(SELECT close FROM prices.bars WHERE bars.ticker = held.ticker AND bars.date <= ? ORDER BY bars.date DESC LIMIT 1)" if has_bars else "NULL"
+            rows = conn.execute(
+                f"""WITH held AS (SELECT ticker, SUM(quantity) AS quantity FROM transactions WHERE date <= ? GROUP BY ticker HAVING ABS(SUM(quantity)) > 1e-9)
+                SELECT ticker, quantity, {close_query} FROM held""",
+                (date_text, date_text) if has_bars else (date_text,)
+            ).fetchall()
+
+        frame = pd.DataFrame(rows, columns = ["Ticker", "Quantity", "Close"]).set_index("Ticker").astype(float)
+        frame["Value"] = frame["Quantity"] * frame["Close"]
+        return frame
+
+    # Writing
+    def Save(self, rows: list, prices: dict | None = None) -> None:
+        '''Rewrites only the changed positions and records a transaction per ticker whose total quantity moved'''
+        rows = [(str(ticker), float(quantity)) for ticker, quantity in rows]
+        with self.lock:
+            if rows == self.rows: return
+
+            today = datetime.now().strftime("%Y-%m-%d")
+            old_totals, new_totals = Totals(self.rows), Totals(rows)
+            changes = {ticker: new_totals.get(ticker, 0.0) - old_totals.get(ticker, 0.0) for ticker in old_totals | new_totals}
+
+            with self.Connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO positions VALUES (?, ?, ?)",
+                    [(idx, ticker, quantity) for idx, (ticker, quantity) in enumerate(rows) if idx >= len(self.rows) or self.rows[idx] != (ticker, quantity)]
+                )
+                conn.execute("DELETE FROM positions WHERE position >= ?", (len(rows),))
+
+                for ticker, delta in changes.items():
+                    if abs(delta) <= 1e-9: continue
+                    price = (prices or {}).get(ticker)
+                    price = None if price is None or price != price else float(price)
+                    conn.execute("INSERT INTO transactions (date, ticker, quantity, price) VALUES (?, ?, ?, ?)", (today, ticker, delta, price))
+                    self.ApplyLots(conn, ticker, delta, today, price)
+
+            self.rows = rows
+
+    @staticmethod
+    def ApplyLots(conn, ticker: str, delta: float, date: str, price: float | None) -> None:
+        '''Buys open a lot, sells close the oldest lots first'''
+        if delta > 0:
+            conn.execute("INSERT INTO lots (ticker, opened, quantity, cost) VALUES (?, ?, ?, ?)", (ticker, date, delta, price))
+            return
+
+        remaining = -delta
+        for lot_id, quantity in conn.execute("SELECT id, quantity FROM lots WHERE ticker = ? ORDER BY opened, id", (ticker,)).fetchall():
+            if remaining <= 1e-9: break
+            if quantity <= remaining + 1e-9:
+                conn.execute("DELETE FROM lots WHERE id = ?", (lot_id,))
+            else:
+                conn.execute("UPDATE lots SET quantity = ? WHERE id = ?", (quantity - remaining, lot_id))
+            remaining -= quantity
+
+class PriceSnapshot:
+    '''Last successful quotes, exchange rates and chart curve as one .npz, read back before anything is fetched'''
+    def __init__(self, path: str = SNAPSHOT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def Load(self) -> dict | None:
+        '''Arrays by name, None when there is no snapshot or it cannot be read'''
+        try:
+            with np.load(self.path, allow_pickle = False) as data:
+                return {name: data[name] for name in data.files}
+        except (EOFError, OSError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def Save(self, **arrays) -> None:
+        '''Replaces the snapshot through a temp file and rename so a crash leaves the previous one intact'''
+        temp_path = self.path + ".tmp"
+        with self.lock:
+            with open(temp_path, "wb") as file:
+                np.savez(file, **arrays)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+
+def QuantityRows(rows: list) -> list:
+    '''(ticker, quantity) pairs from sheet style [ticker, amount] rows, unparsable amounts count as zero'''
+    parsed = []
+    for ticker, amount in rows:
+        try:
+            quantity = float(amount or 0)
+        except ValueError:
+            quantity = 0.0
+        parsed.append((ticker, quantity))
+    return parsed
+
+def Totals(rows: list) -> dict:
+    '''Summed quantity per ticker'''
+    totals = {}
+    for ticker, quantity in rows:
+        totals[ticker] = totals.get(ticker, 0.0) + quantity
+    return totals
@@ -0,0 +1,82 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import math
+
+# Third party
+import numpy as np
+import pandas as pd
+
+# Local modules
+import StockEngine
+from StockEngine import FxMatrix, Portfolio, PreviousCloses, PriceEngine
+#endregion
+
+NAN = float("nan")
+DATES = pd.to_datetime(["2026-10-12", "2026-10-13", "2026-10-14"])
+
+# Previous closes
+def test_previous_close_follows_each_tickers_own_calendar():
+    # AAPL is closed on the 13th, BHP.AX trades every day
+    closes = pd.DataFrame({"AAPL": [100.0, NAN, 103.0], "BHP.AX": [40.0, 41.0, 42.0]}, index = DATES)
+    previous, latest = PreviousCloses(closes)
+
+    assert previous.to_dict() == {"AAPL": 100.0, "BHP.AX": 41.0}
+    assert latest.to_dict() == {"AAPL": 103.0, "BHP.AX": 42.0}
+
+def test_ticker_missing_todays_bar_uses_its_own_last_two_bars():
+    closes = pd.DataFrame({"AAPL": [100.0, 101.0, 102.0], "VOD.L": [70.0, 71.0, NAN]}, index = DATES)
+    previous, latest = PreviousCloses(closes)
+
+    assert (previous["VOD.L"], latest["VOD.L"]) == (70.0, 71.0)
+    assert (previous["AAPL"], latest["AAPL"]) == (101.0, 102.0)
+
+def test_single_row_has_no_previous_close():
+    closes = pd.DataFrame({"AAPL": [100.0], "NONE": [NAN]}, index = DATES[:1])
+    previous, latest = PreviousCloses(closes)
+
+    assert math.isnan(previous["AAPL"]) and latest["AAPL"] == 100.0
+    assert math.isnan(previous["NONE"]) and math.isnan(latest["NONE"])
+
+def test_previous_closes_are_resolved_once_per_session(monkeypatch):
+    resolved = []
+    def Counting(close_data):
+        resolved.append(list(close_data.columns))
+        return PreviousCloses(close_data)
+    monkeypatch.setattr(StockEngine, "PreviousCloses", Counting)
+
+    engine = PriceEngine()
+    engine.ApplyQuotes(pd.DataFrame({"AAPL": [100.0, 101.0, 102.0], "MSFT": [200.0, 201.0, 202.0]}, index = DATES))
+
+    # an intraday refresh moves today's close but keeps the session, nothing is resolved again
+    engine.ApplyQuotes(pd.DataFrame({"AAPL": [100.0, 101.0, 105.0], "MSFT": [200.0, 201.0, 203.0]}, index = DATES))
+    previous, latest = engine.last_prices
+    assert previous.to_dict() == {"AAPL": 101.0, "MSFT": 201.0}
+    assert latest.to_dict() == {"AAPL": 105.0, "MSFT": 203.0}
+
+    # only the ticker with a new session's bar is resolved again
+    dates = DATES.append(pd.DatetimeIndex(["2026-10-15"]))
+    engine.ApplyQuotes(pd.DataFrame({"AAPL": [100.0, 101.0, 105.0, 106.0], "MSFT": [200.0, 201.0, 203.0, NAN]}, index = dates))
+    assert engine.last_prices[0].to_dict() == {"AAPL": 105.0, "MSFT": 201.0}
+    assert resolved == [["AAPL", "MSFT"], ["AAPL"]]
+
+# Exchange rates
+def test_unknown_fx_rate_leaves_the_row_unpriced():
+    engine = PriceEngine()
+    engine.ApplyQuotes(pd.DataFrame({"AAPL": [100.0, 102.0], "VOD.L": [70.0, 72.0], "NZD=X": [1.7, 1.7]}, index = DATES[:2]))
+    valuation = engine.Valuate(Portfolio([("AAPL", 1), ("VOD.L", 10)]))
+
+    assert valuation.SheetRow(1)[1:] == ["n/a", 10.0, "n/a", "n/a"]
+    assert valuation.total_value == 102.0
+    assert math.isnan(FxMatrix().Rate("EUR"))
+
+# Valuation
+def test_valuation_matches_only_the_sheet_it_was_made_from():
+    engine = PriceEngine()
+    engine.ApplyQuotes(pd.DataFrame({"AAPL": [100.0, 102.0], "MSFT": [200.0, 201.0]}, index = DATES[:2]))
+    valuation = engine.Valuate(Portfolio.FromRows([["aapl", "", "2"], ["", "", ""], ["MSFT", "", "1"]]))
+
+    assert valuation.Matches(Portfolio.FromRows([["AAPL", "", 2], ["MSFT", "", "1.0"]]))
+    assert not valuation.Matches(Portfolio.FromRows([["AAPL", "", "5"], ["MSFT", "", "1"]]))
+    assert not valuation.Matches(Portfolio.FromRows([["AAPL", "", "2"], ["MSFT", "", "1"], ["NVDA", "", "1"]]))
+    assert np.array_equal(valuation.Take(valuation.Order("total")).tickers, ["AAPL", "MSFT"])
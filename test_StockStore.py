@@ -0,0 +1,147 @@
+#region IMPORTS + SETTINGS
+
+# standard imports
+import json
+import os
+
+# Third party
+import pandas as pd
+
+# Local modules
+from StockStore import HistoryCache, PortfolioDatabase, PortfolioStore
+#endregion
+
+def WriteSnapshot(path, rows: list) -> None:
+    '''portfolio.json in the format the app has always written'''
+    with open(path, "w") as file:
+        json.dump([{"ticker": ticker, "amount": amount} for ticker, amount in rows], file, indent = 4)
+
+# PortfolioStore journal
+def test_journal_replays_edits_without_compaction(tmp_path):
+    path = str(tmp_path / "portfolio.json")
+    WriteSnapshot(path, [["AAPL", "1"], ["MSFT", "2"]])
+
+    store = PortfolioStore(path)
+    store.Load()
+    store.Save([["AAPL", "5"], ["MSFT", "2"], ["NVDA", "3"]])
+
+    assert PortfolioStore(path).Load() == [["AAPL", "5"], ["MSFT", "2"], ["NVDA", "3"]]
+
+def test_crash_between_rename_and_truncate_does_not_replay_old_entries(tmp_path):
+    path = str(tmp_path / "portfolio.json")
+    WriteSnapshot(path, [["AAPL", "1"]])
+
+    store = PortfolioStore(path, compact_after = 3)
+    store.Load()
+    store.Save([["AAPL", "1"], ["MSFT", "2"]])
+    with open(store.journal_path) as file:
+        old_journal = file.read()
+
+    # this save crosses compact_after, so NVDA only reaches disk through the renamed snapshot
+    store.Save([["AAPL", "1"], ["MSFT", "2"], ["NVDA", "3"]])
+
+    # the process died after the rename but before the journal was emptied
+    with open(store.journal_path, "w") as file:
+        file.write(old_journal)
+
+    # replaying the old "2 rows" entry would drop NVDA again
+    restarted = PortfolioStore(path)
+    assert restarted.Load() == [["AAPL", "1"], ["MSFT", "2"], ["NVDA", "3"]]
+    assert restarted.journal_lines == 0
+
+    # edits after the restart land next to the stale entries and are the only ones replayed
+    restarted.Save([["NVDA", "3"]])
+    assert PortfolioStore(path).Load() == [["NVDA", "3"]]
+
+def test_torn_last_journal_line_is_ignored(tmp_path):
+    path = str(tmp_path / "portfolio.json")
+    WriteSnapshot(path, [["AAPL", "1"]])
+
+    store = PortfolioStore(path)
+    store.Load()
+    store.Save([["AAPL", "7"]])
+    with open(store.journal_path, "a") as file:
+        file.write('{"base": %d, "row": 0, "ticker": "AA' % store.base)
+
+    assert PortfolioStore(path).Load() == [["AAPL", "7"]]
+
+def test_corrupt_snapshot_is_moved_aside(tmp_path):
+    path = str(tmp_path / "portfolio.json")
+    with open(path, "w") as file:
+        file.write('[{"ticker": "AAPL", "amou')
+
+    assert PortfolioStore(path).Load() == []
+    assert not os.path.exists(path)
+
+    backups = [name for name in os.listdir(tmp_path) if name.startswith("portfolio.json.corrupt-")]
+    assert len(backups) == 1
+    with open(tmp_path / backups[0]) as file:
+        assert file.read() == '[{"ticker": "AAPL", "amou'
+
+def test_compaction_writes_the_snapshot_and_empties_the_journal(tmp_path):
+    path = str(tmp_path / "portfolio.json")
+    store = PortfolioStore(path, compact_after = 3)
+    store.Load()
+    store.Save([["AAPL", "1"]])
+    store.Save([["AAPL", "1"], ["MSFT", "2"], ["NVDA", "3"]])
+
+    with open(path) as file:
+        assert json.load(file) == [{"ticker": "AAPL", "amount": "1"}, {"ticker": "MSFT", "amount": "2"}, {"ticker": "NVDA", "amount": "3"}]
+    assert os.path.getsize(store.journal_path) == 0
+
+# PortfolioDatabase
+def OpenDatabase(tmp_path) -> PortfolioDatabase:
+    '''Database with every file in tmp_path so the repo's own portfolio.json is never migrated'''
+    return PortfolioDatabase(str(tmp_path / "portfolio.db"), prices_path = str(tmp_path / "price_cache.db"), legacy_path = str(tmp_path / "portfolio.json"))
+
+def test_sells_consume_the_oldest_lots_first(tmp_path):
+    database = OpenDatabase(tmp_path)
+    database.Save([("AAPL", 10)], {"AAPL": 100.0})
+    database.Save([("AAPL", 15)], {"AAPL": 110.0})
+    opened = database.Lots("AAPL")[0][0]
+
+    database.Save([("AAPL", 12)], {"AAPL": 120.0})
+    assert database.Lots("AAPL") == [(opened, 7.0, 100.0), (opened, 5.0, 110.0)]
+
+    database.Save([("AAPL", 4)], {"AAPL": 120.0})
+    assert database.Lots("AAPL") == [(opened, 4.0, 110.0)]
+
+    database.Save([], {"AAPL": 120.0})
+    assert database.Lots("AAPL") == []
+
+def test_value_on_uses_the_last_cached_close(tmp_path):
+    today = pd.Timestamp.now().normalize()
+    HistoryCache(str(tmp_path / "price_cache.db")).Write(pd.DataFrame(
+        {"AAPL": [100.0, 104.0], "MSFT": [200.0, float("nan")]},
+        index = [today - pd.Timedelta(days = 3), today - pd.Timedelta(days = 1)]
+    ))
+
+    database = OpenDatabase(tmp_path)
+    database.Save([("AAPL", 2), ("MSFT", 1), ("NVDA", 5)])
+
+    frame = database.ValueOn(today)
+    assert frame.loc["AAPL", "Value"] == 208.0
+    assert frame.loc["MSFT", "Close"] == 200.0
+    assert pd.isna(frame.loc["NVDA", "Value"])
+    assert database.ValueOn(today - pd.Timedelta(days = 1)).empty
+
+def test_json_portfolio_is_migrated_once(tmp_path):
+    WriteSnapshot(str(tmp_path / "portfolio.json"), [["AAPL", "3"], ["", ""], ["MSFT", "1.5"]])
+
+    database = OpenDatabase(tmp_path)
+    assert database.Load() == [("AAPL", 3.0), ("", 0.0), ("MSFT", 1.5)]
+
+    WriteSnapshot(str(tmp_path / "portfolio.json"), [["NVDA", "9"]])
+    assert OpenDatabase(tmp_path).Load() == [("AAPL", 3.0), ("", 0.0), ("MSFT", 1.5)]
+
+# HistoryCache top-up
+def test_top_up_starts_from_each_tickers_own_last_bar(tmp_path):
+    cache = HistoryCache(str(tmp_path / "price_cache.db"))
+    dates = pd.to_datetime(["2026-01-05", "2026-01-06", "2026-01-07"])
+    cache.Write(pd.DataFrame({"AAPL": [1.0, 2.0, 3.0], "DEAD": [5.0, float("nan"), float("nan")], "BHP.AX": [7.0, 8.0, 9.0]}, index = dates))
+
+    assert cache.TopUpStarts(["AAPL", "DEAD", "NEW", "BHP.AX"]) == {
+        dates[2]: ["AAPL", "BHP.AX"],
+        dates[0]: ["DEAD"],
+        None: ["NEW"],
+    }